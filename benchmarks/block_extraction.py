@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+'''
+Time of the block extraction of utils.base: the Python double loops used before
+block_gather (kept here as the reference) against the np.ix_ gathers
+
+Usage (from this directory):
+    python block_extraction.py
+'''
+import numpy as np
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+from utils import base
+
+
+def loop_block(M, row_id, col_id):
+    '''
+    Block extraction with a double loop, as in utils.base before block_gather.
+    Diagonal blocks scanned M for symmetry and filled the upper triangle only if M is symmetric
+
+    Arguments:
+    1. M:         The original square matrix M
+    2. row_id:    Row indices of the block
+    3. col_id:    Column indices of the block
+
+    Returns:
+    1. B:         Block matrix
+    '''
+    n_r = len(row_id)
+    n_c = len(col_id)
+    B = np.zeros((n_r, n_c))
+
+    if row_id is col_id and np.allclose(M, M.T):
+        for i in range(n_r):
+            B[i, i] = M[row_id[i], row_id[i]]
+
+            for j in range(i+1, n_r):
+                B[i, j] = M[row_id[i], row_id[j]]
+                B[j, i] = B[i, j]
+    else:
+        for i in range(n_r):
+            for j in range(n_c):
+                B[i, j] = M[row_id[i], col_id[j]]
+
+    return B
+
+
+if __name__ == "__main__":
+    # Symmetric matrices with a random half of the nodes measured,
+    # extracting the measured block and the upper off-diagonal block
+    for n in [500, 1000, 2000, 5000]:
+        rng = np.random.default_rng(0)
+        A = rng.standard_normal((n, n))
+        M = A + A.T
+        perm = rng.permutation(n)
+        measure_id = np.sort(perm[:n//2])
+        hidden_id = np.sort(perm[n//2:])
+
+        start = time.perf_counter()
+        old = (loop_block(M, measure_id, measure_id), loop_block(M, measure_id, hidden_id))
+        t_old = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = (base.block_diag_up(M, measure_id), base.block_off_up(M, measure_id, hidden_id))
+        t_new = time.perf_counter() - start
+
+        assert all(np.array_equal(a, b) for a, b in zip(old, new))
+        print("n = %4d (2 calls): %7.3f s -> %7.4f s (~%.0fx)" % (n, t_old, t_new, t_old / t_new))
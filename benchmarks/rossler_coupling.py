@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+'''
+Time of the tanh coupling of rossler_tanh: the double loop of tanh_couple
+(called once per state dimension) against tanh_couple_edge over the edge list
+
+Usage (from this directory):
+    python rossler_coupling.py
+'''
+import numpy as np
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+from gen_net.er_random import er_random
+from gen_cov.rossler_tanh import tanh_couple, tanh_couple_edge, edge_list
+
+
+def best_time(func, repeat):
+    '''
+    Best wall time of repeated calls of func
+
+    Arguments:
+    1. func:      Function without arguments
+    2. repeat:    Number of calls
+
+    Returns:
+    1. t:         Smallest time of a single call in seconds
+    '''
+    t = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        t = min(t, time.perf_counter() - start)
+
+    return t
+
+
+if __name__ == "__main__":
+    # ER networks with average degree 10 and 3 state dimensions (x, y and z)
+    for N in [50, 100, 200]:
+        np.random.seed(0)
+        W = er_random(N, 10 / (N - 1)).astype(float)
+        state = np.random.randn(N, 3)
+        rows, cols, S = edge_list(W)
+
+        loop = np.stack([tanh_couple(W, state[:, k], N) for k in range(3)], axis=1)
+        edge = tanh_couple_edge(rows, cols, S, state)
+        assert np.allclose(loop, edge)
+
+        t_loop = best_time(lambda: [tanh_couple(W, state[:, k], N) for k in range(3)], 3)
+        t_edge = best_time(lambda: tanh_couple_edge(rows, cols, S, state), 100)
+        print("N = %4d: loop %8.2f ms, edge %8.1f us (~%.0fx)" % (N, t_loop * 1e3, t_edge * 1e6, t_loop / t_edge))
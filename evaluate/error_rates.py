@@ -23,36 +23,41 @@ def error_rates(A, A_reco):
     2. fp:        Number of false positive
     3. num_link:  Number of bi-directional links
     '''
-    assert type(A) == np.ndarray, "A must be of type 'numpy.ndarray'"
-    assert A.size > 0, "A must not be empty"
-    assert A.dtype == int, "Elements in A must be of dtype 'int'"
-    size = A.shape
-    assert len(size) == 2, "A must be of 2D shape"
-    assert size[0] == size[1], "A must be a square matrix"
-    assert np.allclose(A, A.T), "A must be symmetric"
-    assert (np.diag(A) == 0).all(), "Diagonal elements of A must all be zero"
-    assert np.min(A) == 0, "Elements in A must be either 0 or 1"
-    assert np.max(A) <= 1, "Elements in A must be either 0 or 1"
-    assert np.max(A) == 1, "All elements in A are zero"
+    level = base.validation_level()
+    size = np.shape(A)
+    size_reco = np.shape(A_reco)
+    if level != "off":
+        assert type(A) == np.ndarray, "A must be of type 'numpy.ndarray'"
+        assert A.size > 0, "A must not be empty"
+        assert A.dtype == int, "Elements in A must be of dtype 'int'"
+        assert len(size) == 2, "A must be of 2D shape"
+        assert size[0] == size[1], "A must be a square matrix"
 
-    assert type(A_reco) == np.ndarray, "A_reco must be of type 'numpy.ndarray'"
-    assert A_reco.size > 0, "A_reco must not be empty"
-    assert A_reco.dtype == int, "Elements in A_reco must be of dtype 'int'"
-    size_reco = A_reco.shape
-    assert len(size_reco) == 2, "A_reco must be of 2D shape"
-    assert size_reco[0] == size_reco[1], "A_reco must be a square matrix"
-    assert np.allclose(A_reco, A_reco.T), "A_reco must be symmetric"
-    assert (np.diag(A_reco) == 0).all(), "Diagonal elements of A_reco must all be zero"
-    assert np.min(A_reco) == 0, "Elements in A_reco must be either 0 or 1"
-    assert np.max(A_reco) <= 1, "Elements in A must be either 0 or 1"
-    assert np.max(A_reco) == 1, "All elements in A_reco are zero"
+        assert type(A_reco) == np.ndarray, "A_reco must be of type 'numpy.ndarray'"
+        assert A_reco.size > 0, "A_reco must not be empty"
+        assert A_reco.dtype == int, "Elements in A_reco must be of dtype 'int'"
+        assert len(size_reco) == 2, "A_reco must be of 2D shape"
+        assert size_reco[0] == size_reco[1], "A_reco must be a square matrix"
 
-    assert size == size_reco, "A and A_reco must have the same shape"
+        assert size == size_reco, "A and A_reco must have the same shape"
+    if level == "full":
+        assert np.allclose(A, A.T), "A must be symmetric"
+        assert (np.diag(A) == 0).all(), "Diagonal elements of A must all be zero"
+        assert np.min(A) == 0, "Elements in A must be either 0 or 1"
+        assert np.max(A) <= 1, "Elements in A must be either 0 or 1"
+        assert np.max(A) == 1, "All elements in A are zero"
+        assert np.allclose(A_reco, A_reco.T), "A_reco must be symmetric"
+        assert (np.diag(A_reco) == 0).all(), "Diagonal elements of A_reco must all be zero"
+        assert np.min(A_reco) == 0, "Elements in A_reco must be either 0 or 1"
+        assert np.max(A_reco) <= 1, "Elements in A must be either 0 or 1"
+        assert np.max(A_reco) == 1, "All elements in A_reco are zero"
 
     # Extract only the off-diagonl (upper triangle) elements to avoid double counting
     # NOTE: This function requires both A and A_reco to be symmetric
-    A_off = base.off_diag_upper(A)
-    A_reco_off = base.off_diag_upper(A_reco)
+    #       The index tables are shared with off_diag_upper (see triu_index in utils/base.py)
+    row, col = base.triu_index(size[0])
+    A_off = A[row, col]
+    A_reco_off = A_reco[row, col]
 
     # Number of false positive fp, and false negative fn
     fp = np.sum(A_reco_off[A_off == 0] == 1)
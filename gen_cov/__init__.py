@@ -5,5 +5,6 @@ The time series of node (see the details) at each sampling step is used to
 compute the covariance matrix corresponding to all N nodes
 '''
 from gen_cov.logistic_diffusive import logistic_diffusive
+from gen_cov.logistic_diffusive_batch import logistic_diffusive_batch
 from gen_cov.fhn_diffusive import fhn_diffusive
 from gen_cov.rossler_tanh import rossler_tanh
@@ -1,16 +1,71 @@
 #!/usr/bin/env python3
 
 import numpy as np
-from tqdm import tqdm
+from scipy import sparse
 import os
 import sys
 
 ROOT_DIR = os.path.abspath("../")
 sys.path.append(ROOT_DIR)
+from utils import base
+from utils import dynamics
 from utils import network
+from utils import sde
 
 
-def fhn_diffusive(W, epsilon, alpha, sigma, int_dt, sample_dt, sample_start, data_num, get_ts=False):
+def fhn_drift(state, L, epsilon, alpha):
+    '''
+    Drift of the FHN dynamics with diffusive coupling along the x state
+
+    Arguments:
+    1. state:     State of all nodes with shape (2, N), the rows are the x and y states
+    2. L:         Weighted Laplacian matrix
+    3. epsilon:   FHN parameter
+    4. alpha:     FHN parameter
+
+    Returns:
+    1. drift:     d state / dt with the same shape as state
+    '''
+    # NOTE: Since this function is expected to be called from fhn_diffusive,
+    # we do not intend to add assertions as it is checked in fhn_diffusive already
+    x = state[0]
+    y = state[1]
+
+    dx = (x - x*x*x/3 - y)/epsilon - L @ x
+    dy = x + alpha
+
+    return np.stack((dx, dy))
+
+
+def fhn_jacobian(L, epsilon, alpha):
+    '''
+    Jacobian matrix of the drift of the FHN dynamics with diffusive coupling
+    at the fixed point x = -alpha, y = x - x^3/3 of all nodes
+
+    Arguments:
+    1. L:         Weighted Laplacian matrix (dense or sparse)
+    2. epsilon:   FHN parameter
+    3. alpha:     FHN parameter
+
+    Returns:
+    1. J:         Jacobian matrix (dense) of shape (2N, 2N), the first N variables
+                  are the x states and the last N variables are the y states
+    '''
+    # NOTE: Since this function is expected to be called from fhn_diffusive,
+    # we do not intend to add assertions as it is checked in fhn_diffusive already
+    L = L.toarray() if sparse.issparse(L) else L
+    N = L.shape[0]
+    I = np.identity(N)
+
+    x0 = -alpha
+
+    J = np.block([[(1 - x0*x0)/epsilon * I - L, -I/epsilon],
+                  [I, np.zeros((N, N))]])
+
+    return J
+
+
+def fhn_diffusive(W, epsilon, alpha, sigma, int_dt, sample_dt, sample_start, data_num, get_ts=False, analytic=False, dtype=float, **options):
     '''
     Simulate the coupled SDEs with
       - FitzHugh-Nagumo (FHN) dynamics with parameters (epsilon, alpha)
@@ -21,93 +76,118 @@ def fhn_diffusive(W, epsilon, alpha, sigma, int_dt, sample_dt, sample_start, dat
     NOTE: only the x state is used for covariance computation.
 
     Arguments:
-    1. W:               Weighted adjacency matrix of the whole network
+    1. W:               Weighted adjacency matrix of the whole network (dense or scipy.sparse CSR)
     2. epsilon:         FHN parameter
     3. alpha:           FHN parameter
     5. sigma:           Noise strength (standard deviation of Gaussian distribution)
-    6. int_dt:          Integration time step
-    7. sample_dt:       Sampling time step
+    6. int_dt:          Integration time step, or "auto" to choose it from the spectrum of
+                        the linearized dynamics (see auto_dt in utils/sde.py)
+    7. sample_dt:       Sampling time step, or "auto" for about the correlation time of the slowest mode
     8, start_sample:    Time step to start sampling
     9. data_num:        Total number of sampled data for covariance matrix computation
     10. get_ts:         To sample time series of the first node or not (default: False)
+    11. analytic:       To compute the covariance matrix of the dynamics linearized around
+                        the fixed point from the Lyapunov equation, without simulation (default: False)
+    12. dtype:          Data type of the state and the Laplacian matrix (default: float)
+                        np.float32 halves the memory traffic of each step, the moments are still accumulated in float64
+    13. options:        Keyword options of the simulation engine (see simulate in utils/sde.py),
+                        e.g. checkpoint, checkpoint_inter and resume to write checkpoints and continue a run,
+                        or ts_file to stream the sampled states of all nodes to a .npy file,
+                        seed to make the run reproducible, method to select the integrator,
+                        and convergence to stop once the covariance matrix has converged,
+                        or observe to accumulate the moments of the measured nodes only,
+                        and lags to also accumulate lagged covariance matrices,
+                        or backend to select the NumPy or the compiled (numba) integration loop,
+                        and hook to report the progress and metrics (see utils/hooks.py)
 
     Returns:
-    1. cov:        Covariance matrix of the whole network
+    1. cov:        Covariance matrix of the whole network (of the observed nodes if observe is given)
     2. x_ts:       Sampled time series of the first node of the x-state
     3. y_ts:       Sampled time series of the first node of the y-state
+    4. lagged:     moments.LaggedCovariance with the lagged covariance matrices (only returned if lags is given)
     '''
-    assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray'"
-    assert W.size > 0, "W must not be empty"
+    if sparse.issparse(W):
+        assert W.format == "csr", "sparse W must be in CSR format"
+        W_data = W.data
+    else:
+        assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray' or 'scipy.sparse.csr_matrix'"
+        W_data = W
+    assert min(W.shape) > 0, "W must not be empty"
     assert W.dtype == int or W.dtype == float, "W must be of dtype 'int' or 'float'"
-    assert np.isfinite(W).all(), "Elements in W must be finite real numbers"
+    assert np.isfinite(W_data).all(), "Elements in W must be finite real numbers"
     size = W.shape
     assert len(size) == 2, "W must be 2D shape"
     assert size[0] == size[1], "W must be a square matrix"
-    assert (np.diag(W) == 0).all(), "Diagonal elements in W must all be zero"
+    assert (W.diagonal() == 0).all(), "Diagonal elements in W must all be zero"
 
     assert (type(epsilon) == int or type(epsilon) == float) and np.isfinite(epsilon), "epsilon must be a real number"
     assert (type(alpha) == int or type(alpha) == float) and np.isfinite(alpha), "alpha must be a real number"
     assert (type(sigma) == int or type(sigma) == float) and np.isfinite(sigma) and sigma > 0, "sigma must be a positive real number"
 
-    assert (type(int_dt) == int or type(int_dt) == float) and np.isfinite(int_dt) and int_dt > 0, "int_dt must be a positive real number"
-    assert (type(sample_dt) == int or type(sample_dt) == float) and np.isfinite(sample_dt) and sample_dt > int_dt, "sample_dt, must be a positive real number, and greater than int_dt"
+    assert int_dt == "auto" or ((type(int_dt) == int or type(int_dt) == float) and np.isfinite(int_dt) and int_dt > 0), "int_dt must be a positive real number or 'auto'"
+    assert sample_dt == "auto" or ((type(sample_dt) == int or type(sample_dt) == float) and np.isfinite(sample_dt) and (int_dt == "auto" or sample_dt > int_dt)), "sample_dt, must be a positive real number, and greater than int_dt, or 'auto'"
     assert type(sample_start) == int and sample_start >= 0, "sample_start must be a non-negative integer"
-    assert type(data_num) == int and data_num > sample_dt, "data_num must be a positive integer, and greater than sample_dt"
+    assert type(data_num) == int and (sample_dt == "auto" or data_num > sample_dt), "data_num must be a positive integer, and greater than sample_dt"
     assert type(get_ts) == bool, "get_ts must be boolean"
+    assert type(analytic) == bool, "analytic must be boolean"
+    assert np.dtype(dtype) in (np.float32, np.float64), "dtype must be 'float32' or 'float64'"
+    assert not analytic or options.get('lags') is None, "lags is not supported with analytic"
 
     # Compute weighted Laplacian matrix
     # This is used for simplifying the computation when
     # the coupling function h(x-y) = y - x
-    L = network.laplacian(W)
+    # NOTE: L is sparse if W is sparse, then the coupling costs O(|E|) per step
+    # NOTE: W is checked above, so the Laplacian trusts it
+    with base.validation("off"):
+        L = network.laplacian(W, dtype)
+
+    # Covariance matrix of the linearized dynamics of the 2N variables
+    # with noise injected on the x states only
+    if analytic:
+        N = size[0]
+        J = fhn_jacobian(L, epsilon, alpha)
+        noise = np.concatenate((sigma**2 * np.ones((N,)), np.zeros((N,))))
+        cov = dynamics.lyapunov_covariance(J, noise)[:N, :N]
+        if options.get('observe') is not None:
+            cov = cov[np.ix_(options['observe'], options['observe'])]
+
+        return cov, None, None
+
+    # Local dynamics at the fixed point, only the x state is coupled through -L x
+    x0 = -alpha
+    J0 = np.array([[(1 - x0*x0)/epsilon, -1/epsilon], [1, 0]])
+    coupling = np.array([1.0, 0.0])
+
+    # Choose the time steps from the spectrum of the linearized dynamics
+    int_dt, sample_dt = sde.resolve_dt(int_dt, sample_dt, J0, coupling, L, options.get('method', 'euler'))
 
     # Sampling time interval
     sample_inter = int(sample_dt/int_dt)
 
-    # Total number of iteration
-    T = int((data_num) * sample_inter + sample_start)
-
     # Initialize the current state of N nodes
+    # The rows of state are the x and y states respectively
     N = size[0]
-    x = np.random.normal(loc=0.5, scale=0.01, size=(N,))
-    y = np.random.normal(loc=0.5, scale=0.01, size=(N,))
+    state = sde.initial_state((2, N), options.get('seed'), dtype)
+
+    # Solve the coupled SDEs using Euler-Maruyama method
+    # NOTE: The compiled drift of the numba backend (see utils/jit.py) is used if it is available
+    acc, ts = sde.simulate(fhn_drift, (L, epsilon, alpha), state, sigma, int_dt, sample_inter, sample_start, data_num,
+                           get_ts=get_ts, laplacian=L,
+                           jit_drift=("fhn", (L, epsilon, alpha, dtype)), **options)
 
-    # Initialize the 1st and 2nd moment matrix of the state vector x
-    # They are used to compute the covariance matrix
-    m_01 = np.zeros((N,))
-    m_02 = np.zeros((N, N))
+    # Compute the covariance matrix of the whole network
+    cov = acc[0].cov()
 
-    # Initialize the sampled time series of the first node
+    # Sampled time series of the first node
     if get_ts:
-        x_ts = np.zeros((int(T/sample_inter),))
-        y_ts = np.zeros((int(T/sample_inter),))
-        i = 0
+        x_ts = ts[0]
+        y_ts = ts[1]
     else:
         x_ts = None
         y_ts = None
 
-    # Solve the coupled SDEs using Euler-Maruyama method
-    for t in tqdm(range(T)):
-        eta = np.random.normal(size=(N,))
-
-        x_old = x
-        x += ((x - x*x*x/3 - y)/epsilon - np.matmul(L, x)) * int_dt + sigma*np.sqrt(int_dt)*eta
-        y += (x_old + alpha) * int_dt
-
-        # Sample the node states
-        if t % sample_inter == 0:
-
-            # Sample dynamics of the first node
-            if get_ts:
-                x_ts[i] = x[0]
-                y_ts[i] = x[0]
-                i += 1
-
-            # Sample 1st and 2nd moment
-            if t >= sample_start:
-                m_01 += x/data_num
-                m_02 += np.outer(x, x)/data_num
-
-    # Compute the covariance matrix of the whole network
-    cov = m_02 - np.outer(m_01, m_01)
+    # The lagged covariance matrices are returned after the documented values
+    if options.get('lags') is not None:
+        return cov, x_ts, y_ts, acc[0].lagged()
 
     return cov, x_ts, y_ts
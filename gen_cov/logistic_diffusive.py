@@ -1,16 +1,58 @@
 #!/usr/bin/env python3
 
 import numpy as np
-from tqdm import tqdm
+from scipy import sparse
 import os
 import sys
 
 ROOT_DIR = os.path.abspath("../")
 sys.path.append(ROOT_DIR)
+from utils import base
+from utils import dynamics
 from utils import network
+from utils import sde
 
 
-def logistic_diffusive(W, r, sigma, int_dt, sample_dt, sample_start, data_num, get_ts=False):
+def logistic_drift(state, L, r):
+    '''
+    Drift of the logistic dynamics with diffusive coupling
+
+    Arguments:
+    1. state:   State of all nodes with shape (1, N) or (1, N, R)
+    2. L:       Weighted Laplacian matrix
+    3. r:       Parameter of f(x)
+
+    Returns:
+    1. drift:   d state / dt with the same shape as state
+    '''
+    # NOTE: Since this function is expected to be called from logistic_diffusive,
+    # we do not intend to add assertions as it is checked in logistic_diffusive already
+    x = state[0]
+
+    return (r*x*(1-x) - L @ x)[np.newaxis]
+
+
+def logistic_jacobian(L, r):
+    '''
+    Jacobian matrix of the drift of the logistic dynamics with diffusive coupling
+    at the stable fixed point x = 1 of all nodes, i.e. J = -(L + aI) with a = -f'(1) = r
+
+    Arguments:
+    1. L:       Weighted Laplacian matrix (dense or sparse)
+    2. r:       Parameter of f(x)
+
+    Returns:
+    1. J:       Jacobian matrix (dense)
+    '''
+    # NOTE: Since this function is expected to be called from logistic_diffusive,
+    # we do not intend to add assertions as it is checked in logistic_diffusive already
+    L = L.toarray() if sparse.issparse(L) else L
+    N = L.shape[0]
+
+    return -(L + r * np.identity(N))
+
+
+def logistic_diffusive(W, r, sigma, int_dt, sample_dt, sample_start, data_num, get_ts=False, analytic=False, dtype=float, **options):
     '''
     Simulate the coupled SDEs with
       - f(x)   = rx(1-x)
@@ -19,87 +61,104 @@ def logistic_diffusive(W, r, sigma, int_dt, sample_dt, sample_start, data_num, g
     and obtain the covariance matrix of the whole network.
 
     Arguments:
-    1. W:               Weighted adjacency matrix of the whole network
+    1. W:               Weighted adjacency matrix of the whole network (dense or scipy.sparse CSR)
     2. r:               Parameter of f(x)
     3. sigma:           Noise strength (standard deviation of Gaussian distribution)
-    4. int_dt:          Integration time step
-    5. sample_dt:       Sampling time step
+    4. int_dt:          Integration time step, or "auto" to choose it from the spectrum of
+                        the linearized dynamics (see auto_dt in utils/sde.py)
+    5. sample_dt:       Sampling time step, or "auto" for about the correlation time of the slowest mode
     6, start_sample:    Time step to start sampling
     7. data_num:        Total number of sampled data for covariance matrix computation
     8. get_ts:          To sample time series of the first node or not (default: False)
+    9. analytic:        To compute the covariance matrix of the dynamics linearized around
+                        the fixed point from the Lyapunov equation, without simulation (default: False)
+    10. dtype:          Data type of the state and the Laplacian matrix (default: float)
+                        np.float32 halves the memory traffic of each step, the moments are still accumulated in float64
+    11. options:        Keyword options of the simulation engine (see simulate in utils/sde.py),
+                        e.g. checkpoint, checkpoint_inter and resume to write checkpoints and continue a run,
+                        or ts_file to stream the sampled states of all nodes to a .npy file,
+                        seed to make the run reproducible, method to select the integrator,
+                        and convergence to stop once the covariance matrix has converged,
+                        or observe to accumulate the moments of the measured nodes only,
+                        and lags to also accumulate lagged covariance matrices,
+                        or backend to select the NumPy or the compiled (numba) integration loop,
+                        and hook to report the progress and metrics (see utils/hooks.py)
 
     Returns:
-    1. cov:        Covariance matrix of the whole network
+    1. cov:        Covariance matrix of the whole network (of the observed nodes if observe is given)
     2. x_ts:       Sampled time series of the first node
+    3. lagged:     moments.LaggedCovariance with the lagged covariance matrices (only returned if lags is given)
     '''
-    assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray'"
-    assert W.size > 0, "W must not be empty"
+    if sparse.issparse(W):
+        assert W.format == "csr", "sparse W must be in CSR format"
+        W_data = W.data
+    else:
+        assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray' or 'scipy.sparse.csr_matrix'"
+        W_data = W
+    assert min(W.shape) > 0, "W must not be empty"
     assert W.dtype == int or W.dtype == float, "W must of dtype 'int' or 'float'"
-    assert np.isfinite(W).all(), "Elements in W must be finite real numbers"
+    assert np.isfinite(W_data).all(), "Elements in W must be finite real numbers"
     size = W.shape
     assert len(size) == 2, "W must be 2D shape"
     assert size[0] == size[1], "W must be a square matrix"
-    assert (np.diag(W) == 0).all(), "W must not have self-loop"
+    assert (W.diagonal() == 0).all(), "W must not have self-loop"
 
     assert (type(r) == int or type(r) == float) and np.isfinite(r) and r > 0, "r must be a positive real number"
     assert (type(sigma) == int or type(sigma) == float) and np.isfinite(sigma) and sigma > 0, "sigma must be a positive real number"
-    assert (type(int_dt) == int or type(int_dt) == float) and np.isfinite(int_dt) and int_dt > 0, "int_dt must be a positive real number"
-    assert (type(sample_dt) == int or type(sample_dt) == float) and np.isfinite(sample_dt) and sample_dt > int_dt, "sample_dt step must be a positive real number, and greater than int_dt"
+    assert int_dt == "auto" or ((type(int_dt) == int or type(int_dt) == float) and np.isfinite(int_dt) and int_dt > 0), "int_dt must be a positive real number or 'auto'"
+    assert sample_dt == "auto" or ((type(sample_dt) == int or type(sample_dt) == float) and np.isfinite(sample_dt) and (int_dt == "auto" or sample_dt > int_dt)), "sample_dt step must be a positive real number, and greater than int_dt, or 'auto'"
     assert type(sample_start) == int and sample_start >= 0, "sample_start must be a non-negative integer"
-    assert type(data_num) == int and data_num > sample_dt, "data_num must be a positive integer, and greater than sample_dt"
+    assert type(data_num) == int and (sample_dt == "auto" or data_num > sample_dt), "data_num must be a positive integer, and greater than sample_dt"
 
     assert type(get_ts) == bool, "get_ts must be boolean"
+    assert type(analytic) == bool, "analytic must be boolean"
+    assert np.dtype(dtype) in (np.float32, np.float64), "dtype must be 'float32' or 'float64'"
+    assert not analytic or options.get('lags') is None, "lags is not supported with analytic"
 
     # Compute weighted Laplacian matrix
     # This is used for simplifying the computation when
     # the coupling function h(x-y) = y - x
-    L = network.laplacian(W)
+    # NOTE: L is sparse if W is sparse, then the coupling costs O(|E|) per step
+    # NOTE: W is checked above, so the Laplacian trusts it
+    with base.validation("off"):
+        L = network.laplacian(W, dtype)
+
+    # Covariance matrix of the linearized dynamics, J S + S J^T + sigma^2 I = 0
+    if analytic:
+        J = logistic_jacobian(L, r)
+        cov = dynamics.lyapunov_covariance(J, sigma**2 * np.ones((size[0],)))
+        if options.get('observe') is not None:
+            cov = cov[np.ix_(options['observe'], options['observe'])]
+
+        return cov, None
+
+    # Local dynamics f'(1) = -r of the x state, which is coupled through -L x
+    J0 = np.array([[-r]])
+    coupling = np.ones((1,))
+
+    # Choose the time steps from the spectrum of the linearized dynamics
+    int_dt, sample_dt = sde.resolve_dt(int_dt, sample_dt, J0, coupling, L, options.get('method', 'euler'))
 
     # Sampling time interval
     sample_inter = int(sample_dt/int_dt)
 
-    # Total number of iteration
-    T = int((data_num) * sample_inter + sample_start)
-
     # Initialize the current state of N nodes
     N = size[0]
-    x = np.random.normal(loc=0.5, scale=0.01, size=(N,))
-
-    # Initialize the 1st and 2nd moment matrix of the state vector x
-    # They are used to compute the covariance matrix
-    m_01 = np.zeros((N,))
-    m_02 = np.zeros((N, N))
-
-    # Initialize the sampled time series of the first node
-    if get_ts:
-        x_ts = np.zeros((int(T/sample_inter),))
-        i = 0
-    else:
-        x_ts = None
+    state = sde.initial_state((1, N), options.get('seed'), dtype)
 
     # Solve the coupled SDEs using Euler-Maruyama method
-    for t in tqdm(range(T)):
-        eta = np.random.normal(size=(N,))
-        x += r*x*(1-x)*int_dt - np.matmul(L, x)*int_dt + sigma*np.sqrt(int_dt)*eta
-
-        # Stop the program if there is at least one node blows up
-        if np.isnan(x).any() or np.isinf(x).any():
-            assert False, "The dynamics blows up!"
+    # NOTE: The compiled drift of the numba backend (see utils/jit.py) is used if it is available
+    acc, ts = sde.simulate(logistic_drift, (L, r), state, sigma, int_dt, sample_inter, sample_start, data_num,
+                           get_ts=get_ts, laplacian=L, jit_drift=("logistic", (L, r, dtype)), **options)
 
-        # Sample the node states
-        if t % sample_inter == 0:
-
-            # Sample dynamics of the first node
-            if get_ts:
-                x_ts[i] = x[0]
-                i += 1
+    # Compute the covariance matrix of the whole network
+    cov = acc[0].cov()
 
-            # Sample 1st and 2nd moment
-            if t >= sample_start:
-                m_01 += x/data_num
-                m_02 += np.outer(x, x)/data_num
+    # Sampled time series of the first node
+    x_ts = ts[0] if get_ts else None
 
-    # Compute the covariance matrix of the whole network
-    cov = m_02 - np.outer(m_01, m_01)
+    # The lagged covariance matrices are returned after the documented values
+    if options.get('lags') is not None:
+        return cov, x_ts, acc[0].lagged()
 
     return cov, x_ts
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from scipy import sparse
+import os
+import sys
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+from utils import base
+from utils import moments
+from utils import network
+from utils import sde
+from gen_cov.logistic_diffusive import logistic_drift
+
+
+def logistic_diffusive_batch(W, r, sigma, int_dt, sample_dt, sample_start, data_num, replica, dtype=float, **options):
+    '''
+    Simulate R independent realizations (replicas) of the coupled SDEs with
+      - f(x)   = rx(1-x)
+      - h(x[i] - x[j]) = x[j] - x[i]
+
+    and obtain the covariance matrix of the whole network.
+    The replicas are advanced together as an (N, R) state block, so that
+    the coupling term of each step is a single matrix-matrix product.
+
+    Arguments:
+    1. W:               Weighted adjacency matrix of the whole network (dense or scipy.sparse CSR)
+    2. r:               Parameter of f(x)
+    3. sigma:           Noise strength (standard deviation of Gaussian distribution)
+    4. int_dt:          Integration time step, or "auto" to choose it from the spectrum of
+                        the linearized dynamics (see auto_dt in utils/sde.py)
+    5. sample_dt:       Sampling time step, or "auto" for about the correlation time of the slowest mode
+    6, start_sample:    Time step to start sampling
+    7. data_num:        Number of sampled data of each replica for covariance matrix computation
+    8. replica:         Number of independent realizations R
+    9. dtype:           Data type of the state and the Laplacian matrix (default: float)
+                        np.float32 halves the memory traffic of each step, the moments are still accumulated in float64
+    10. options:        Keyword options of the simulation engine (see simulate in utils/sde.py),
+                        e.g. checkpoint, checkpoint_inter and resume to write checkpoints and continue a run,
+                        or ts_file to stream the sampled states of all nodes to a .npy file,
+                        seed to make the run reproducible, method to select the integrator,
+                        and convergence to stop once the covariance matrix has converged,
+                        or observe to accumulate the moments of the measured nodes only,
+                        and lags to also accumulate lagged covariance matrices,
+                        or hook to report the progress and metrics (see utils/hooks.py)
+
+    Returns:
+    1. cov:        Covariance matrix of the whole network (of the observed nodes if observe is given)
+                   pooled over all replicas
+    2. cov_rep:    Covariance matrices of each replica with shape (R, N, N)
+    3. lagged:     moments.LaggedCovariance with the lagged covariance matrices pooled over all replicas
+                   (only returned if lags is given)
+    '''
+    if sparse.issparse(W):
+        assert W.format == "csr", "sparse W must be in CSR format"
+        W_data = W.data
+    else:
+        assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray' or 'scipy.sparse.csr_matrix'"
+        W_data = W
+    assert min(W.shape) > 0, "W must not be empty"
+    assert W.dtype == int or W.dtype == float, "W must of dtype 'int' or 'float'"
+    assert np.isfinite(W_data).all(), "Elements in W must be finite real numbers"
+    size = W.shape
+    assert len(size) == 2, "W must be 2D shape"
+    assert size[0] == size[1], "W must be a square matrix"
+    assert (W.diagonal() == 0).all(), "W must not have self-loop"
+
+    assert (type(r) == int or type(r) == float) and np.isfinite(r) and r > 0, "r must be a positive real number"
+    assert (type(sigma) == int or type(sigma) == float) and np.isfinite(sigma) and sigma > 0, "sigma must be a positive real number"
+    assert int_dt == "auto" or ((type(int_dt) == int or type(int_dt) == float) and np.isfinite(int_dt) and int_dt > 0), "int_dt must be a positive real number or 'auto'"
+    assert sample_dt == "auto" or ((type(sample_dt) == int or type(sample_dt) == float) and np.isfinite(sample_dt) and (int_dt == "auto" or sample_dt > int_dt)), "sample_dt step must be a positive real number, and greater than int_dt, or 'auto'"
+    assert type(sample_start) == int and sample_start >= 0, "sample_start must be a non-negative integer"
+    assert type(data_num) == int and (sample_dt == "auto" or data_num > sample_dt), "data_num must be a positive integer, and greater than sample_dt"
+    assert type(replica) == int and replica > 0, "replica must be a positive integer"
+    assert np.dtype(dtype) in (np.float32, np.float64), "dtype must be 'float32' or 'float64'"
+
+    # Compute weighted Laplacian matrix
+    # This is used for simplifying the computation when
+    # the coupling function h(x-y) = y - x
+    # NOTE: L is sparse if W is sparse, then the coupling costs O(|E|) per step
+    # NOTE: W is checked above, so the Laplacian trusts it
+    with base.validation("off"):
+        L = network.laplacian(W, dtype)
+
+    # Local dynamics f'(1) = -r of the x state, which is coupled through -L x
+    J0 = np.array([[-r]])
+    coupling = np.ones((1,))
+
+    # Choose the time steps from the spectrum of the linearized dynamics
+    int_dt, sample_dt = sde.resolve_dt(int_dt, sample_dt, J0, coupling, L, options.get('method', 'euler'))
+
+    # Sampling time interval
+    sample_inter = int(sample_dt/int_dt)
+
+    # Initialize the current state of N nodes for all R replicas
+    # Each column is one replica
+    N = size[0]
+    state = sde.initial_state((1, N, replica), options.get('seed'), dtype)
+
+    # Solve the coupled SDEs using Euler-Maruyama method
+    acc, _ = sde.simulate(logistic_drift, (L, r), state, sigma, int_dt, sample_inter, sample_start, data_num,
+                          laplacian=L, **options)
+
+    # Compute the covariance matrix of each replica
+    cov_rep = np.stack([acc[k].cov() for k in range(replica)])
+
+    # Pool the samples of all replicas together
+    # NOTE: The lagged pairs of different replicas are never mixed
+    if options.get('lags') is None:
+        pool = moments.MomentAccumulator(acc[0].N)
+    else:
+        pool = moments.LagAccumulator(acc[0].N, options['lags'])
+    for k in range(replica):
+        pool.merge(acc[k])
+    cov = pool.cov()
+
+    # The lagged covariance matrices are returned after the documented values
+    if options.get('lags') is not None:
+        return cov, cov_rep, pool.lagged()
+
+    return cov, cov_rep
@@ -1,7 +1,16 @@
 #!/usr/bin/env python3
 
 import numpy as np
-from tqdm import tqdm
+from scipy import sparse
+import os
+import sys
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+from utils import base
+from utils import dynamics
+from utils import network
+from utils import sde
 
 
 def tanh_couple(W, state, N):
@@ -34,7 +43,137 @@ def tanh_couple(W, state, N):
     return interaction
 
 
-def rossler_tanh(W, c1, c2, c3, sigma, int_dt, sample_dt, sample_start, data_num, get_ts=False):
+def edge_list(W, dtype=float):
+    '''
+    Build the edge list of the weighted adjacency matrix W for tanh_couple_edge
+
+    Arguments:
+    1. W:       Weighted adjacency matrix of the whole network (dense or scipy.sparse CSR)
+    2. dtype:   Data type of the weights (default: float)
+
+    Returns:
+    1. rows:    Row index i of every edge (i, j) with W[i, j] != 0
+    2. cols:    Column index j of every edge (i, j) with W[i, j] != 0
+    3. S:       Sparse scatter matrix of shape (N, |E|) with S[i, e] = W[i, j]
+                for the edge e = (i, j), such that S @ v sums v over the edges of each node
+    '''
+    # NOTE: Since this function is expected to be called from rossler_tanh,
+    # we do not intend to add assertions as it is checked in rossler_tanh already
+    W = sparse.csr_matrix(W, dtype=dtype)
+    W.eliminate_zeros()
+    N = W.shape[0]
+    E = W.nnz
+
+    rows = np.repeat(np.arange(N), np.diff(W.indptr))
+    cols = W.indices.copy()
+
+    # Edges are stored row by row in CSR format, so the scatter matrix shares
+    # the row pointer of W and has exactly one entry per column (edge)
+    S = sparse.csr_matrix((W.data.copy(), np.arange(E), W.indptr.copy()), shape=(N, E))
+
+    return rows, cols, S
+
+
+def tanh_couple_edge(rows, cols, S, state):
+    '''
+    Vectorized version of tanh_couple over the edge list of W.
+    It gathers state[j] - state[i] over all edges (i, j), applies tanh
+    and scatter-adds the weighted result to node i, which costs O(|E|)
+
+    Arguments:
+    1. rows:    Row indices of the edges (see edge_list)
+    2. cols:    Column indices of the edges (see edge_list)
+    3. S:       Sparse scatter matrix (see edge_list)
+    4. state:   State variables of all nodes with shape (N,) or (N, d),
+                e.g. (N, 3) to couple the x, y and z states in one pass
+
+    Returns
+    1. interaction:   The interaction between node i and others,
+                        with the same shape as state
+    '''
+    # NOTE: Since this function is expected to be called from rossler_tanh,
+    # we do not intend to add assertions as it is checked in rossler_tanh already
+    interaction = S @ np.tanh(state[cols] - state[rows])
+
+    return interaction
+
+
+def rossler_drift(state, rows, cols, S, c1, c2, c3):
+    '''
+    Drift of the Rossler dynamics with tanh diffusive coupling
+
+    Arguments:
+    1. state:   State of all nodes with shape (3, N), the rows are the x, y and z states
+    2. rows:    Row indices of the edges (see edge_list)
+    3. cols:    Column indices of the edges (see edge_list)
+    4. S:       Sparse scatter matrix (see edge_list)
+    5. c1:      Rossler parameter
+    6. c2:      Rossler parameter
+    7. c3:      Rossler parameter
+
+    Returns:
+    1. drift:   d state / dt with the same shape as state
+    '''
+    # NOTE: Since this function is expected to be called from rossler_tanh,
+    # we do not intend to add assertions as it is checked in rossler_tanh already
+    x = state[0]
+    y = state[1]
+    z = state[2]
+
+    # Coupling of the x, y and z states in one pass over the edges
+    interaction = tanh_couple_edge(rows, cols, S, state.T).T
+
+    dx = -y - z + interaction[0]
+    dy = x + c1*y + interaction[1]
+    dz = c2 + z*(x - c3) + interaction[2]
+
+    return np.stack((dx, dy, dz))
+
+
+def rossler_jacobian(L, c1, c2, c3):
+    '''
+    Jacobian matrix of the drift of the Rossler dynamics with tanh diffusive coupling
+    at a stable fixed point of all nodes. Since tanh'(0) = 1, the coupling
+    linearizes to -L along each state variable at any homogeneous state
+
+    The fixed points of a single Rossler system are
+        x = (c3 +- sqrt(c3^2 - 4 c1 c2)) / 2,   y = -x/c1,   z = x/c1
+
+    Arguments:
+    1. L:       Weighted Laplacian matrix (dense or sparse)
+    2. c1:      Rossler parameter
+    3. c2:      Rossler parameter
+    4. c3:      Rossler parameter
+
+    Returns:
+    1. J:       Jacobian matrix (dense) of shape (3N, 3N) at the first stable fixed point
+                (if none is stable, at the last fixed point), the variables are
+                ordered as the x, y and z states
+    '''
+    # NOTE: Since this function is expected to be called from rossler_tanh,
+    # we do not intend to add assertions as it is checked in rossler_tanh already
+    L = L.toarray() if sparse.issparse(L) else L
+    N = L.shape[0]
+    I = np.identity(N)
+    O = np.zeros((N, N))
+
+    disc = c3*c3 - 4*c1*c2
+    assert disc >= 0 and c1 != 0, "The Rossler dynamics has no fixed point"
+
+    for x0 in ((c3 - np.sqrt(disc))/2, (c3 + np.sqrt(disc))/2):
+        z0 = x0/c1
+
+        J = np.block([[-L, -I, -I],
+                      [I, c1*I - L, O],
+                      [z0*I, O, (x0 - c3)*I - L]])
+
+        if np.max(np.linalg.eigvals(J).real) < 0:
+            break
+
+    return J
+
+
+def rossler_tanh(W, c1, c2, c3, sigma, int_dt, sample_dt, sample_start, data_num, get_ts=False, analytic=False, dtype=float, **options):
     '''
     Simulate the coupled SDEs with
       - Rossler dynamics (c1, c2, c3) are those standard parameters
@@ -45,100 +184,127 @@ def rossler_tanh(W, c1, c2, c3, sigma, int_dt, sample_dt, sample_start, data_num
     NOTE: only the x state is used for covariance computation.
 
     Arguments:
-    1. W:               Weighted adjacency matrix of the whole network
+    1. W:               Weighted adjacency matrix of the whole network (dense or scipy.sparse CSR)
     2. c1:              Rossler parameter
     3. c2:              Rossler parameter
     4. c3:              Rossler parameter
     5. sigma:           Noise strength (standard deviation of Gaussian distribution)
-    6. int_dt:          Integration time step
-    7. sample_dt:       Sampling time step
+    6. int_dt:          Integration time step, or "auto" to choose it from the spectrum of
+                        the linearized dynamics (see auto_dt in utils/sde.py)
+    7. sample_dt:       Sampling time step, or "auto" for about the correlation time of the slowest mode
     8, start_sample:    Time step to start sampling
     9. data_num:        Total number of sampled data for covariance matrix computation
     10. get_ts:         To sample time series of the first node or not (default: False)
+    11. analytic:       To compute the covariance matrix of the dynamics linearized around
+                        a stable fixed point from the Lyapunov equation, without simulation (default: False)
+                        NOTE: the fixed points are unstable for the standard chaotic parameters
+    12. dtype:          Data type of the state and the coupling (default: float)
+                        np.float32 halves the memory traffic of each step, the moments are still accumulated in float64
+    13. options:        Keyword options of the simulation engine (see simulate in utils/sde.py),
+                        e.g. checkpoint, checkpoint_inter and resume to write checkpoints and continue a run,
+                        or ts_file to stream the sampled states of all nodes to a .npy file,
+                        seed to make the run reproducible, method to select the integrator,
+                        and convergence to stop once the covariance matrix has converged,
+                        or observe to accumulate the moments of the measured nodes only,
+                        and lags to also accumulate lagged covariance matrices,
+                        or backend to select the NumPy or the compiled (numba) integration loop,
+                        and hook to report the progress and metrics (see utils/hooks.py)
 
     Returns:
-    1. cov:        Covariance matrix of the whole network
+    1. cov:        Covariance matrix of the whole network (of the observed nodes if observe is given)
     2. x_ts:       Sampled time series of the first node of the x-state
     3. y_ts:       Sampled time series of the first node of the y-state
     4. z_ts:       Sampled time series of the first node of the z-state
+    5. lagged:     moments.LaggedCovariance with the lagged covariance matrices (only returned if lags is given)
     '''
-    assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray'"
-    assert W.size > 0, "W must not be empty"
+    if sparse.issparse(W):
+        assert W.format == "csr", "sparse W must be in CSR format"
+        W_data = W.data
+    else:
+        assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray' or 'scipy.sparse.csr_matrix'"
+        W_data = W
+    assert min(W.shape) > 0, "W must not be empty"
     assert W.dtype == int or W.dtype == float, "W must of dtype 'int' or 'float'"
-    assert np.isfinite(W).all(), "Elements in W must be finite real numbers"
+    assert np.isfinite(W_data).all(), "Elements in W must be finite real numbers"
     size = W.shape
     assert len(size) == 2, "W must be 2D shape"
     assert size[0] == size[1], "W must be a square matrix"
-    assert (np.diag(W) == 0).all(), "Diagonal elements in W must all be zero"
+    assert (W.diagonal() == 0).all(), "Diagonal elements in W must all be zero"
     assert (type(c1) == int or type(c1) == float) and np.isfinite(c1), "c1 must be a real number"
     assert (type(c2) == int or type(c2) == float) and np.isfinite(c2), "c2 must be a real number"
     assert (type(c3) == int or type(c3) == float) and np.isfinite(c3), "c3 must be a real number"
 
     assert (type(sigma) == int or type(sigma) == float) and np.isfinite(sigma) and sigma > 0, "sigma must be a positive real number"
-    assert (type(int_dt) == int or type(int_dt) == float) and np.isfinite(int_dt) and int_dt > 0, "int_dt must be a positive real number"
-    assert (type(sample_dt) == int or type(sample_dt) == float) and np.isfinite(sample_dt) and sample_dt > int_dt, "sample_dt must be a positive real number, and greater than int_dt"
+    assert int_dt == "auto" or ((type(int_dt) == int or type(int_dt) == float) and np.isfinite(int_dt) and int_dt > 0), "int_dt must be a positive real number or 'auto'"
+    assert sample_dt == "auto" or ((type(sample_dt) == int or type(sample_dt) == float) and np.isfinite(sample_dt) and (int_dt == "auto" or sample_dt > int_dt)), "sample_dt must be a positive real number, and greater than int_dt, or 'auto'"
     assert type(sample_start) == int and sample_start >= 0, "sample_start must be a non-negative integer"
-    assert type(data_num) == int and data_num > sample_dt, "data_num must be a positive integer, and greater than sample_dt"
+    assert type(data_num) == int and (sample_dt == "auto" or data_num > sample_dt), "data_num must be a positive integer, and greater than sample_dt"
 
     assert type(get_ts) == bool, "get_ts must be boolean"
+    assert type(analytic) == bool, "analytic must be boolean"
+    assert np.dtype(dtype) in (np.float32, np.float64), "dtype must be 'float32' or 'float64'"
+    assert not analytic or options.get('lags') is None, "lags is not supported with analytic"
+
+    # Covariance matrix of the linearized dynamics of the 3N variables
+    # with noise injected on the x states only
+    if analytic:
+        N = size[0]
+        J = rossler_jacobian(network.laplacian(W), c1, c2, c3)
+        noise = np.concatenate((sigma**2 * np.ones((N,)), np.zeros((2*N,))))
+        cov = dynamics.lyapunov_covariance(J, noise)[:N, :N]
+        if options.get('observe') is not None:
+            cov = cov[np.ix_(options['observe'], options['observe'])]
+
+        return cov, None, None, None
+
+    # Build the edge list of W for the tanh coupling function
+    rows, cols, S = edge_list(W, dtype)
+
+    # The tanh coupling linearizes to -L x along each of the x, y and z states,
+    # which is integrated exactly by the exponential scheme (see utils/sde.py)
+    # NOTE: W is checked above, so the Laplacian trusts it
+    with base.validation("off"):
+        L = network.laplacian(W, dtype)
+
+    # Local dynamics at the fixed point closest to the origin,
+    # all the x, y and z states are coupled through -L x (to the linear order)
+    disc = c3*c3 - 4*c1*c2
+    x0 = (c3 - np.sqrt(max(disc, 0)))/2
+    z0 = x0/c1 if c1 != 0 else 0
+    J0 = np.array([[0, -1, -1], [1, c1, 0], [z0, 0, x0 - c3]])
+    coupling = np.ones((3,))
+
+    # Choose the time steps from the spectrum of the linearized dynamics
+    int_dt, sample_dt = sde.resolve_dt(int_dt, sample_dt, J0, coupling, L, options.get('method', 'euler'))
 
     # Sampling time interval
     sample_inter = int(sample_dt/int_dt)
 
-    # Total number of iteration
-    T = int((data_num) * sample_inter + sample_start)
-
     # Initialize the current state of N nodes
+    # The rows of state are the x, y and z states respectively
     N = size[0]
-    x = np.random.normal(loc=0.5, scale=0.01, size=(N,))
-    y = np.random.normal(loc=0.5, scale=0.01, size=(N,))
-    z = np.random.normal(loc=0.5, scale=0.01, size=(N,))
+    state = sde.initial_state((3, N), options.get('seed'), dtype)
+
+    # Solve the coupled SDEs using Euler-Maruyama method
+    # NOTE: The compiled drift of the numba backend (see utils/jit.py) is used if it is available
+    acc, ts = sde.simulate(rossler_drift, (rows, cols, S, c1, c2, c3), state, sigma, int_dt, sample_inter, sample_start, data_num,
+                           get_ts=get_ts, laplacian=L, coupled=3, jit_drift=("rossler", (W, c1, c2, c3, dtype)), **options)
 
-    # Initialize the 1st and 2nd moment matrix of the state vector x
-    # They are used to compute the covariance matrix
-    m_01 = np.zeros((N,))
-    m_02 = np.zeros((N, N))
+    # Compute the covariance matrix of the whole network
+    cov = acc[0].cov()
 
-    # Initialize the sampled time series of the first node
+    # Sampled time series of the first node
     if get_ts:
-        x_ts = np.zeros((int(T/sample_inter),))
-        y_ts = np.zeros((int(T/sample_inter),))
-        z_ts = np.zeros((int(T/sample_inter),))
-        i = 0
+        x_ts = ts[0]
+        y_ts = ts[1]
+        z_ts = ts[2]
     else:
         x_ts = None
         y_ts = None
         z_ts = None
 
-    # Solve the coupled SDEs using Euler-Maruyama method
-    for t in tqdm(range(T)):
-        eta = np.random.normal(size=(N,))
-
-        interaction_x = tanh_couple(W, x, N)
-        interaction_y = tanh_couple(W, y, N)
-        interaction_z = tanh_couple(W, z, N)
-
-        x_old = x
-        x += (-y - z + interaction_x) * int_dt + sigma*np.sqrt(int_dt)*eta
-        y += (x_old + c1*y + interaction_y) * int_dt
-        z += (c2 + z*(x_old - c3) + interaction_z) * int_dt
-
-        # Sample the node states
-        if t % sample_inter == 0:
-
-            # Sample dynamics of the first node
-            if get_ts:
-                x_ts[i] = x[0]
-                y_ts[i] = x[0]
-                z_ts[i] = x[0]
-                i += 1
-
-            # Sample 1st and 2nd moment
-            if t >= sample_start:
-                m_01 += x/data_num
-                m_02 += np.outer(x, x)/data_num
-
-    # Compute the covariance matrix of the whole network
-    cov = m_02 - np.outer(m_01, m_01)
+    # The lagged covariance matrices are returned after the documented values
+    if options.get('lags') is not None:
+        return cov, x_ts, y_ts, z_ts, acc[0].lagged()
 
     return cov, x_ts, y_ts, z_ts
@@ -28,20 +28,23 @@ def kmeans(data, n, k=2):
     Returns:
     1. A_reco:      Reconstructed adjacency matrix
     '''
-    assert type(data) == np.ndarray, "data must be of type 'numpy.ndarray'"
-    assert data.size > 0, "data must not be empty"
-    assert data.dtype == int or data.dtype == float, "data must be of dtype 'int' or 'float'"
-    assert np.isfinite(data).all(), "data elements must be real numbers"
-    size = data.shape
-    assert len(size) == 1, "data must be 1D shape"
-    n_data = size[0]
-    assert n_data > 1, "data must have at least two elements for clustering"
-
-    # Solution to quadratic equation: n_data = n_node * (n_node - 1) / 2
-    n_node = 0.5 * (1 + np.sqrt(1 + 8*n_data))
-    assert n_node.is_integer(), "data are not taken from upper/lower off-diagonal elements"
-    assert int(n_node) == n, "Number of elements in data is inconsistent with n"
-    assert type(k) == int and k > 1, "k must be a positive integer and not less than 2"
+    level = base.validation_level()
+    if level != "off":
+        assert type(data) == np.ndarray, "data must be of type 'numpy.ndarray'"
+        assert data.size > 0, "data must not be empty"
+        assert data.dtype == int or data.dtype == float, "data must be of dtype 'int' or 'float'"
+        size = data.shape
+        assert len(size) == 1, "data must be 1D shape"
+        n_data = size[0]
+        assert n_data > 1, "data must have at least two elements for clustering"
+
+        # Solution to quadratic equation: n_data = n_node * (n_node - 1) / 2
+        n_node = 0.5 * (1 + np.sqrt(1 + 8*n_data))
+        assert n_node.is_integer(), "data are not taken from upper/lower off-diagonal elements"
+        assert int(n_node) == n, "Number of elements in data is inconsistent with n"
+        assert type(k) == int and k > 1, "k must be a positive integer and not less than 2"
+    if level == "full":
+        assert np.isfinite(data).all(), "data elements must be real numbers"
 
     n_data = data.shape[0]
     n_node = int(0.5*(1 + np.sqrt(1 + 8*n_data)))
@@ -69,8 +72,8 @@ def kmeans(data, n, k=2):
     row, col = base.index_recover(n)
 
     # Get the connected pair indices
-    row_conn_triu = row[reco_indices != ucon_id].astype("int")
-    col_conn_triu = col[reco_indices != ucon_id].astype("int")
+    row_conn_triu = row[reco_indices != ucon_id]
+    col_conn_triu = col[reco_indices != ucon_id]
 
     # Initialize the reconstructed adjacency matrix with zero elements
     A_reco = np.zeros((n, n))
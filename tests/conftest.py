@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+# The packages import each other from the root of the repository
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import numpy as np
+import pytest
+
+from gen_net.er_random import er_random
+from gen_cov import logistic_diffusive
+
+
+# Logistic dynamics on a 20-node ER network, lambda_max(L) = 12, so int_dt = 0.02 gives lambda_max * dt = 0.24
+R = 2
+SIGMA = 0.05
+INT_DT = 0.02
+SAMPLE_DT = 0.4
+SAMPLE_START = 250
+
+
+@pytest.fixture(scope="session")
+def W():
+    np.random.seed(7)
+    return er_random(20, 0.3).astype(float)
+
+
+@pytest.fixture(scope="session")
+def run_logistic(W):
+    '''
+    Run logistic_diffusive on the shared network with the shared parameters
+
+    Arguments:
+    1. data_num:  Number of samples
+    2. options:   Keyword arguments of logistic_diffusive (e.g. method, seed, dtype, backend, hook)
+
+    Returns:
+    1. Return values of logistic_diffusive
+    '''
+    def run(data_num, **options):
+        return logistic_diffusive(W, R, SIGMA, INT_DT, SAMPLE_DT, SAMPLE_START, data_num, **options)
+
+    return run
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+'''
+Calls of the instrumentation hooks of simulate (see utils/hooks.py)
+'''
+import pytest
+
+from utils import hooks
+from utils import jit
+
+
+@pytest.mark.parametrize("backend", ["numpy", pytest.param("numba", marks=pytest.mark.skipif(not jit.HAS_NUMBA, reason="numba is not installed"))])
+def test_hook_with_checkpoints(run_logistic, backend, tmp_path):
+    hook = hooks.MetricsHook(inter=1000)
+    run_logistic(1000, seed=3, backend=backend, hook=hook, checkpoint=str(tmp_path / "c.npz"), checkpoint_inter=7000)
+
+    # Every multiple of inter before T = 20250, and sample_start
+    assert len(hook.history) == 21
+    assert list(hook.phases) == ["burn-in", "sampling", "finalize"]
+
+
+def test_metrics_hook_reused(run_logistic):
+    hook = hooks.MetricsHook(inter=1000)
+    for _ in range(2):
+        run_logistic(1000, seed=3, hook=hook)
+
+    assert len(hook.history) == 21
+    assert hook.steps == 20250
+    assert sum(hook.phases.values()) <= hook.elapsed
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+'''
+Convergence of the integrators of simulate (see utils/sde.py)
+to the covariance matrix of the linearized dynamics from the Lyapunov equation
+'''
+import pytest
+
+from utils import dynamics
+
+
+# The relative error of the precision matrix has a sampling floor of about 0.045 with 10000 samples
+DATA_NUM = 10000
+
+
+@pytest.fixture(scope="module")
+def cov_ref(run_logistic):
+    cov_ref, _ = run_logistic(DATA_NUM, analytic=True)
+
+    return cov_ref
+
+
+def err_inv(run_logistic, cov_ref, method):
+    cov, _ = run_logistic(DATA_NUM, method=method, seed=3)
+
+    return dynamics.covariance_distance(cov, cov_ref)[1]
+
+
+@pytest.mark.parametrize("method", ["heun", "exponential"])
+def test_converges_to_lyapunov(run_logistic, cov_ref, method):
+    assert err_inv(run_logistic, cov_ref, method) < 0.07
+
+
+def test_euler_is_biased_at_large_dt(run_logistic, cov_ref):
+    assert err_inv(run_logistic, cov_ref, "euler") > 0.09
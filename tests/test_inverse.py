@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+'''
+Symmetric positive definite inverse (see spd_inverse in utils/base.py)
+'''
+import numpy as np
+import pytest
+
+from utils import base
+from utils import dynamics
+
+
+def spd_matrix(n, cond, seed=0):
+    '''
+    Random SPD matrix of size n with the 2-norm condition number cond
+    '''
+    rng = np.random.default_rng(seed)
+    Q, _ = np.linalg.qr(rng.standard_normal((n, n)))
+    M = (Q * np.geomspace(1, cond, n)) @ Q.T
+
+    return 0.5 * (M + M.T)
+
+
+def test_accepts_what_inverse_accepts():
+    cov = spd_matrix(200, 5e4)
+    assert base.inverse(cov) is not None
+
+    cov_inv, chol = base.spd_inverse(cov, factor=True)
+    assert np.allclose(cov_inv @ cov, np.identity(200), atol=1e-6)
+    assert np.allclose(base.spd_solve(chol, np.identity(200)), cov_inv)
+
+    measure_id = np.arange(150)
+    hidden_id = np.arange(150, 200)
+    cov_inv_m, cov_m_inv = dynamics.inverse_covariance(cov, measure_id, hidden_id)
+    assert np.allclose(cov_m_inv, np.linalg.inv(cov[:150, :150]))
+
+
+def test_rejects_singular():
+    with pytest.raises(base.SingularMatrixError):
+        base.spd_inverse(spd_matrix(50, 1e12))
+
+    # Borderline range of the 1-norm estimate, tol <= cond < N * tol
+    for n in (200, 2000):
+        with pytest.raises(base.SingularMatrixError):
+            base.spd_inverse(spd_matrix(n, 1e6))
+    with pytest.raises(np.linalg.LinAlgError):
+        base.spd_inverse(np.diag([1.0, -1.0]))
+
+
+def test_inverse_covariance_rejects_asymmetric():
+    cov = spd_matrix(20, 10)
+    cov[0, 1] += 0.1
+
+    with pytest.raises(AssertionError):
+        dynamics.inverse_covariance(cov, np.arange(15), np.arange(15, 20))
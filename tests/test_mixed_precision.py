@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+'''
+Error of the float32 mode of the gen_cov models against float64 with the same seed
+'''
+import numpy as np
+import pytest
+
+from utils import dynamics
+
+
+@pytest.mark.parametrize("method", ["euler", "heun", "exponential"])
+def test_float32_precision_matrix(run_logistic, method):
+    cov_64, _ = run_logistic(4000, method=method, seed=3)
+    cov_32, _ = run_logistic(4000, method=method, seed=3, dtype=np.float32)
+
+    assert dynamics.covariance_distance(cov_32, cov_64)[1] < 1e-5
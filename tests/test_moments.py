@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+'''
+Moments of a stream of state vectors (see utils/moments.py)
+'''
+import numpy as np
+
+from utils import moments
+
+
+def lagged_reference(X, lag):
+    '''
+    K(tau) = E[(x(t) - mean)(x(t - tau) - mean)^T] with the mean of all samples
+    '''
+    D = X - X.mean(0)
+
+    return D[lag:].T @ D[:-lag] / (len(X) - lag)
+
+
+def test_lagged_covariance_common_mean():
+    rng = np.random.default_rng(0)
+    X = 3 + rng.standard_normal((1000, 4)).cumsum(0) * 0.01 + rng.standard_normal((1000, 4))
+    lags = [1, 7, 50]
+
+    acc = moments.LagAccumulator(4, lags, block=64)
+    acc.push_block(X)
+    res = acc.lagged()
+
+    assert np.allclose(res.cov, np.cov(X.T, bias=True))
+    for i, lag in enumerate(lags):
+        assert np.allclose(res.cov_lag[i], lagged_reference(X, lag))
+
+
+def test_lagged_covariance_merged():
+    rng = np.random.default_rng(1)
+    X = 3 + rng.standard_normal((600, 3))
+    Y = -2 + rng.standard_normal((400, 3))
+
+    a = moments.LagAccumulator(3, [2], block=32)
+    b = moments.LagAccumulator(3, [2], block=32)
+    a.push_block(X)
+    b.push_block(Y)
+    a.merge(b)
+
+    # Pairs straddling the two accumulators are not counted
+    mean = np.concatenate((X, Y)).mean(0)
+    DX = X - mean
+    DY = Y - mean
+    ref = (DX[2:].T @ DX[:-2] + DY[2:].T @ DY[:-2]) / (598 + 398)
+
+    assert np.allclose(a.lagged().cov_lag[0], ref)
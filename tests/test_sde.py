@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+'''
+Random streams of the SDE engine (see utils/sde.py)
+'''
+import numpy as np
+
+from utils import sde
+
+
+class Dispatched(Exception):
+    pass
+
+
+class RecordingPool:
+    '''
+    Stand-in of ProcessPoolExecutor, which records the jobs of the chains instead of running them
+    '''
+    jobs = []
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, f, jobs):
+        RecordingPool.jobs = list(jobs)
+        raise Dispatched
+
+
+def test_initial_state_is_independent_of_chain_noise(monkeypatch):
+    monkeypatch.setattr(sde, "ProcessPoolExecutor", RecordingPool)
+
+    state = sde.initial_state((1, 5), seed=11)
+    try:
+        sde.simulate(lambda s, *p: -s, (), state, 0.1, 0.01, 10, 0, 100, chains=3, seed=11)
+    except Dispatched:
+        pass
+
+    # The initial state is drawn from the child (0,) of the seed, which no chain uses
+    keys = [options['seed'].spawn_key for _, options in RecordingPool.jobs]
+    assert keys == [(1,), (2,), (3,)]
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+'''
+Levels of the input validation (see set_validation in utils/base.py)
+'''
+import threading
+
+import numpy as np
+import pytest
+
+from utils import base
+
+
+def test_levels():
+    M = np.ones((3, 3))
+    M[0, 0] = np.nan
+    measure_id = np.array([0, 1])
+
+    with pytest.raises(AssertionError):
+        base.block_diag_up(M, measure_id)
+    with base.validation("cheap"):
+        base.block_diag_up(M, measure_id)
+        with pytest.raises(AssertionError):
+            base.block_diag_up(M.tolist(), measure_id)
+
+    assert base.validation_level() == "full"
+
+
+def test_context_is_local_to_thread():
+    entered = threading.Event()
+    done = threading.Event()
+    levels = []
+
+    def check():
+        entered.wait()
+        levels.append(base.validation_level())
+        done.set()
+
+    thread = threading.Thread(target=check)
+    thread.start()
+    with base.validation("off"):
+        entered.set()
+        done.wait()
+    thread.join()
+
+    assert levels == ["full"]
@@ -3,3 +3,5 @@
 import utils.base as base
 import utils.network as network
 import utils.dynamics as dynamics
+import utils.moments as moments
+import utils.hooks as hooks
@@ -1,6 +1,79 @@
 #!/usr/bin/env python3
 
 import numpy as np
+from scipy.linalg import cho_solve, get_lapack_funcs
+from collections import OrderedDict
+from contextvars import ContextVar
+
+
+# Cache of the upper triangle indices of each matrix size n (see triu_index)
+# The least recently used tables are evicted once they take more than TRIU_CACHE_LIMIT bytes
+TRIU_CACHE = OrderedDict()
+TRIU_CACHE_LIMIT = 2**28
+
+# Level of the input validation of the functions in utils, reconstruct and evaluate (see set_validation)
+VALIDATION = "full"
+VALIDATION_LEVELS = ("full", "cheap", "off")
+
+# Level set by the context manager validation, which overrides VALIDATION within its own call chain only,
+# i.e. the current thread (or asyncio task), such that other threads keep their checks
+VALIDATION_OVERRIDE = ContextVar("validation", default=None)
+
+
+def validation_level():
+    '''
+    Returns:
+    1. level:   Current level of the input validation, "full", "cheap" or "off"
+    '''
+    level = VALIDATION_OVERRIDE.get()
+
+    return VALIDATION if level is None else level
+
+
+def set_validation(level):
+    '''
+    Set the default level of the input validation of all threads
+
+    Arguments:
+    1. level:   "full" to check the types, shapes and values of the inputs (default),
+                "cheap" to check only the types and shapes, which cost O(1),
+                "off" to trust the inputs, e.g. in a hot loop whose inputs were checked once already
+                NOTE: The value checks (finite elements, symmetry, zero diagonal, disjoint indices)
+                      scan the whole matrix in O(N^2), which is comparable to the work of the
+                      cheap functions such as block extraction
+    '''
+    global VALIDATION
+    assert level in VALIDATION_LEVELS, "level must be 'full', 'cheap' or 'off'"
+
+    VALIDATION = level
+
+
+class validation:
+    '''
+    Context manager to change the level of the input validation within a block,
+    the previous level is restored on exit. Unlike set_validation, it only affects
+    the calls within the block of the current thread, e.g.
+
+        with base.validation("off"):
+            for hidden_id in splits:
+                ...
+
+    Arguments:
+    1. level:   Level of the input validation within the block (see set_validation)
+    '''
+
+    def __init__(self, level):
+        assert level in VALIDATION_LEVELS, "level must be 'full', 'cheap' or 'off'"
+
+        self.level = level
+
+    def __enter__(self):
+        self.token = VALIDATION_OVERRIDE.set(self.level)
+        return self
+
+    def __exit__(self, *exc):
+        VALIDATION_OVERRIDE.reset(self.token)
+        return False
 
 
 def eigen_values(M):
@@ -13,13 +86,16 @@ def eigen_values(M):
     Returns:
     1. eig_vals:   Eigen-values of matrix M
     '''
-    assert type(M) == np.ndarray, "M must be of type 'numpy.ndarray'"
-    assert M.size > 0, "M must not be empty"
-    assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
-    assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
-    size = M.shape
-    assert len(size) == 2, "M must be 2D shape"
-    assert size[0] == size[1], "M must be a square matrix"
+    level = validation_level()
+    size = np.shape(M)
+    if level != "off":
+        assert type(M) == np.ndarray, "M must be of type 'numpy.ndarray'"
+        assert M.size > 0, "M must not be empty"
+        assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "M must be 2D shape"
+        assert size[0] == size[1], "M must be a square matrix"
+    if level == "full":
+        assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
 
     eig_vals, _ = np.linalg.eig(M)
 
@@ -37,14 +113,17 @@ def inverse(M, tol=1e5):
     Returns:
     1. M_inv:   Inverse of the matrix M
     '''
-    assert type(M) == np.ndarray, "M must be of type 'numpy.ndarray'"
-    assert M.size > 0, "M must not be empty"
-    assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
-    assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
-    size = M.shape
-    assert len(size) == 2, "M must be 2D shape"
-    assert size[0] == size[1], "M must be a square matrix"
-    assert (type(tol) == int or type(tol) == float) and np.isfinite(tol) and tol >= 0, "tol must be a non-negative number"
+    level = validation_level()
+    size = np.shape(M)
+    if level != "off":
+        assert type(M) == np.ndarray, "M must be of type 'numpy.ndarray'"
+        assert M.size > 0, "M must not be empty"
+        assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "M must be 2D shape"
+        assert size[0] == size[1], "M must be a square matrix"
+        assert (type(tol) == int or type(tol) == float) and np.isfinite(tol) and tol >= 0, "tol must be a non-negative number"
+    if level == "full":
+        assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
 
     cond_num = np.linalg.cond(M)
 
@@ -57,6 +136,169 @@ def inverse(M, tol=1e5):
     return M_inv
 
 
+class SingularMatrixError(np.linalg.LinAlgError):
+    '''
+    Raised by spd_inverse if the matrix is not positive definite,
+    or its condition number is not smaller than the tolerance
+    '''
+
+
+def spd_inverse(M, tol=1e5, factor=False):
+    '''
+    Compute the inverse of a symmetric positive definite matrix M, e.g. a covariance matrix
+    or Lh + aI (a >= 0) of the hidden nodes, with one Cholesky factorization.
+    The condition number is estimated from the factor by LAPACK (?pocon) in O(N^2),
+    instead of the SVD of np.linalg.cond, and the inverse is formed from the factor (?potri)
+
+    Arguments:
+    1. M:        A symmetric positive definite matrix
+    2. tol:      Tolerance value of condition number (default: 1e5)
+                 NOTE: The estimate is of the 1-norm condition number, which is at most N times
+                       the 2-norm condition number checked by inverse. If the estimate is between
+                       tol and N * tol, the exact 2-norm condition number decides, so M is accepted
+                       if and only if it is accepted by inverse
+    3. factor:   To also return the Cholesky factor for reuse (default: False)
+
+    Returns:
+    1. M_inv:    Inverse of the matrix M
+    2. chol:     Cholesky factor (c, lower) of M, which can be passed to spd_solve
+                 or scipy.linalg.cho_solve (only if factor is True)
+
+    Raises:
+    1. SingularMatrixError if M is not positive definite or highly singular
+    '''
+    level = validation_level()
+    size = np.shape(M)
+    if level != "off":
+        assert type(M) == np.ndarray, "M must be of type 'numpy.ndarray'"
+        assert M.size > 0, "M must not be empty"
+        assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "M must be 2D shape"
+        assert size[0] == size[1], "M must be a square matrix"
+        assert (type(tol) == int or type(tol) == float) and np.isfinite(tol) and tol >= 0, "tol must be a non-negative number"
+        assert type(factor) == bool, "factor must be boolean"
+    if level == "full":
+        assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
+        assert np.allclose(M, M.T), "M must be symmetric"
+
+    if M.dtype == int:
+        M = M.astype(float)
+
+    potrf, pocon, potri = get_lapack_funcs(('potrf', 'pocon', 'potri'), (M,))
+
+    # Cholesky factorization M = C C^T, only the lower triangle of M is referenced
+    c, info = potrf(M, lower=1, clean=1)
+    if info > 0:
+        raise SingularMatrixError("M is not positive definite (leading minor of order %d)" % info)
+
+    # Reciprocal of the 1-norm condition number
+    anorm = np.max(np.sum(np.abs(M), axis=0))
+    rcond, _ = pocon(c, anorm, uplo='L')
+    if rcond * tol <= 1:
+        # NOTE: cond_1 <= N cond_2, so the 2-norm condition number (ratio of the extreme eigenvalues of M)
+        #       is only computed in the borderline range tol <= cond_1 < N * tol
+        if rcond * tol * size[0] > 1:
+            eig_vals = np.linalg.eigvalsh(M)
+            cond_num = eig_vals[-1] / eig_vals[0]
+        else:
+            cond_num = 1 / rcond if rcond > 0 else np.inf
+
+        if cond_num >= tol:
+            raise SingularMatrixError("M is highly singular (condition number %.3g)" % cond_num)
+
+    # Inverse from the factor, LAPACK fills the lower triangle only
+    M_inv, _ = potri(c, lower=1, overwrite_c=int(not factor))
+    M_inv = np.tril(M_inv) + np.tril(M_inv, -1).T
+
+    if factor:
+        return M_inv, (c, True)
+
+    return M_inv
+
+
+def spd_solve(chol, B):
+    '''
+    Solve M X = B with the Cholesky factor of M from spd_inverse in O(N^2) per column
+
+    Arguments:
+    1. chol:     Cholesky factor (c, lower) of M returned by spd_inverse(M, factor=True)
+    2. B:        Right-hand side with shape (N,) or (N, K)
+
+    Returns:
+    1. X:        Solution with the same shape as B
+    '''
+    assert type(chol) == tuple and len(chol) == 2, "chol must be the Cholesky factor returned by spd_inverse"
+    assert type(B) == np.ndarray and B.shape[0] == chol[0].shape[0], "B must have the same number of rows as M"
+
+    return cho_solve(chol, B)
+
+
+def triu_index(n):
+    '''
+    Row and column indices of the off-diagonal elements (upper triangle) of an n x n matrix,
+    in the (row-major) order of off_diag_upper. The tables are computed once per n and kept
+    in a bounded LRU cache (TRIU_CACHE), so repeated calls with the same n do no index work
+
+    Arguments:
+    1. n:      The matrix size
+
+    Returns:
+    1. row:    Row indices (read-only, int32, or int64 for n > 2^31 - 1)
+    2. col:    Column indices (read-only, int32, or int64 for n > 2^31 - 1)
+    '''
+    assert type(n) == int and n > 0, "n must be a positive integer"
+
+    if n in TRIU_CACHE:
+        TRIU_CACHE.move_to_end(n)
+        return TRIU_CACHE[n]
+
+    dtype = np.int32 if n <= np.iinfo(np.int32).max else np.int64
+    row, col = np.triu_indices(n, 1)
+    row = row.astype(dtype)
+    col = col.astype(dtype)
+
+    # The cached tables are shared by all callers
+    row.flags.writeable = False
+    col.flags.writeable = False
+
+    # A table larger than the limit is returned without caching
+    if row.nbytes + col.nbytes <= TRIU_CACHE_LIMIT:
+        TRIU_CACHE[n] = (row, col)
+        while triu_cache_info()['bytes'] > TRIU_CACHE_LIMIT:
+            TRIU_CACHE.popitem(last=False)
+
+    return row, col
+
+
+def triu_cache_info():
+    '''
+    Report the memory used by the cached tables of triu_index
+
+    Returns:
+    1. info:    Dictionary of the cached matrix sizes (sizes), the bytes used (bytes)
+                and the maximum number of bytes (limit)
+    '''
+    return dict(sizes=list(TRIU_CACHE.keys()),
+                bytes=sum(row.nbytes + col.nbytes for row, col in TRIU_CACHE.values()),
+                limit=TRIU_CACHE_LIMIT)
+
+
+def triu_cache_limit(limit):
+    '''
+    Set the maximum number of bytes of the cached tables of triu_index,
+    the least recently used tables are evicted to fit
+
+    Arguments:
+    1. limit:   Maximum number of bytes (0 to disable the cache)
+    '''
+    global TRIU_CACHE_LIMIT
+    assert type(limit) == int and limit >= 0, "limit must be a non-negative integer"
+
+    TRIU_CACHE_LIMIT = limit
+    while TRIU_CACHE and triu_cache_info()['bytes'] > TRIU_CACHE_LIMIT:
+        TRIU_CACHE.popitem(last=False)
+
+
 def off_diag_upper(M):
     '''
     Extract the off-diagonal elements (upper triangle) of a square matrix
@@ -68,15 +310,19 @@ def off_diag_upper(M):
     1. off:     off-diagonal elements (upper triangle) of input matrix M
     '''
 
-    assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
-    assert M.size > 0, "M must not be empty"
-    assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
-    assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
-    size = M.shape
-    assert len(size) == 2, "M must be 2D shape"
-    assert size[0] == size[1], "M must be a square matrix"
+    level = validation_level()
+    size = np.shape(M)
+    if level != "off":
+        assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
+        assert M.size > 0, "M must not be empty"
+        assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "M must be 2D shape"
+        assert size[0] == size[1], "M must be a square matrix"
+    if level == "full":
+        assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
 
-    off_upper = M[np.triu(np.ones(size), 1) == 1]
+    row, col = triu_index(size[0])
+    off_upper = M[row, col]
 
     return off_upper
 
@@ -90,36 +336,68 @@ def index_recover(n):
     1. n:    The original matrix size
 
     Returns:
-    1. row:  Row indices
-    2. col:  Column indices
+    1. row:  Row indices (read-only integer array, see triu_index)
+    2. col:  Column indices (read-only integer array, see triu_index)
     '''
 
     assert type(n) == int and n > 0, "n must be a positive integer"
 
-    v_size = int(n*(n-1)/2)
+    row, col = triu_index(n)
 
-    # Recover the row index and column index
-    row = np.zeros((v_size,))
-    col = np.zeros((v_size,))
+    return row, col
 
-    for i in range(n-1):
-        bin_size = n-1-i
 
-        if i == 0:
-            start = 0
-            end = bin_size
-        else:
-            start = end
-            end = start + bin_size
+def index_slice(ids):
+    '''
+    Slice equivalent to an index array if its elements are consecutive and ascending
 
-        row[start:end] = i * np.ones((bin_size,))
-        col[start:end] = sorted(np.arange(n-1, i, -1))
+    Arguments:
+    1. ids:     1D array of indices
 
-    return row, col
+    Returns:
+    1. s:       slice(ids[0], ids[-1] + 1), or None if ids is not a consecutive ascending range
+    '''
+    if ids.size > 0 and ids[-1] - ids[0] + 1 == ids.size and (np.diff(ids) == 1).all():
+        return slice(int(ids[0]), int(ids[-1]) + 1)
+
+    return None
+
+
+def block_gather(M, row_id, col_id, out=None, view=False):
+    '''
+    Gather the block matrix M[row_id[i], col_id[j]] with one fancy indexing (np.ix_)
+
+    Arguments:
+    1. M:         The original square matrix M
+    2. row_id:    Row indices of the block
+    3. col_id:    Column indices of the block
+    4. out:       Preallocated float array of shape (len(row_id), len(col_id)) to write the block to
+                  (default: None, i.e. a new array)
+    5. view:      To return a view of M without copying if both row_id and col_id
+                  are consecutive ascending ranges (default: False)
+
+    Returns:
+    1. B:         Block matrix (float, or a view of M)
+    '''
+    # NOTE: Since this function is expected to be called from the block_ functions,
+    # we do not intend to add assertions as it is checked in the block_ functions already
+    if view and out is None:
+        row_slice = index_slice(row_id)
+        col_slice = index_slice(col_id)
+        if row_slice is not None and col_slice is not None:
+            return M[row_slice, col_slice]
 
+    if out is None:
+        return M[np.ix_(row_id, col_id)].astype(float)
 
+    assert type(out) == np.ndarray and out.dtype == float, "out must be a float 'numpy.ndarray'"
+    assert out.shape == (len(row_id), len(col_id)), "out must have the shape of the block"
+    out[...] = M[np.ix_(row_id, col_id)]
 
-def block_diag_up(M, measure_id):
+    return out
+
+
+def block_diag_up(M, measure_id, out=None, view=False):
     '''
     Extract the block matrix from matrix M with row and column 
     correspond to measured nodes
@@ -127,45 +405,37 @@ def block_diag_up(M, measure_id):
     Arguments:
     1. M:            The original square matrix M
     2. measure_id:   Measured node indices of the original matrix M
+    3. out:          Preallocated float array to write B to (default: None)
+    4. view:         To return a view of M if measure_id is a consecutive ascending range (default: False)
 
     Returns:
     1. B:          Block matrix with elements equal to the original matrix
                    formed among the measure nodes
     '''
-    assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
-    assert M.size > 0, "M must not be empty"
-    assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
-    assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
-    size = M.shape
-    assert len(size) == 2, "M must be 2D shape"
-    assert size[0] == size[1], "M must be a square matrix"
-
-    assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
-    assert measure_id.size > 0, "measure_id must not be empty"
-    assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
-    assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
-    assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
-    assert np.max(measure_id) < size[0], "measure_id elements must be smaller than the input matrix size"
-
-    n = len(measure_id)
-    B = np.zeros((n, n))
-
-    if np.allclose(M, M.T):
-        for i in range(n):
-            B[i, i] = M[measure_id[i], measure_id[i]]
-
-            for j in range(i+1, n):
-                B[i, j] = M[measure_id[i], measure_id[j]]
-                B[j, i] = B[i, j]
-    else:
-        for i in range(n):
-            for j in range(n):
-                B[i, j] = M[measure_id[i], measure_id[j]]
+    level = validation_level()
+    size = np.shape(M)
+    if level != "off":
+        assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
+        assert M.size > 0, "M must not be empty"
+        assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "M must be 2D shape"
+        assert size[0] == size[1], "M must be a square matrix"
+
+        assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
+        assert measure_id.size > 0, "measure_id must not be empty"
+        assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
+        assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
+    if level == "full":
+        assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
+        assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
+        assert np.max(measure_id) < size[0], "measure_id elements must be smaller than the input matrix size"
+
+    B = block_gather(M, measure_id, measure_id, out, view)
 
     return B
 
 
-def block_diag_low(M, hidden_id):
+def block_diag_low(M, hidden_id, out=None, view=False):
     '''
     Extract the block matrix from matrix M with row and column 
     correspond to hidden nodes
@@ -173,45 +443,37 @@ def block_diag_low(M, hidden_id):
     Arguments:
     1. M:            The original square matrix M
     2. hidden_id:    Hidden node indices of the original matrix M
+    3. out:          Preallocated float array to write B to (default: None)
+    4. view:         To return a view of M if hidden_id is a consecutive ascending range (default: False)
 
     Returns:
     1. B:          Block matrix with elements equal to the original matrix
                    formed among the hidden nodes
     '''
-    assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
-    assert M.size > 0, "M must not be empty"
-    assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
-    assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
-    size = M.shape
-    assert len(size) == 2, "M must be 2D shape"
-    assert size[0] == size[1], "M must be a square matrix"
-
-    assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
-    assert hidden_id.size > 0, "hidden_id must not be empty"
-    assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
-    assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
-    assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
-    assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
-
-    n = len(hidden_id)
-    B = np.zeros((n, n))
-
-    if np.allclose(M, M.T):
-        for i in range(n):
-            B[i, i] = M[hidden_id[i], hidden_id[i]]
-
-            for j in range(i+1, n):
-                B[i, j] = M[hidden_id[i], hidden_id[j]]
-                B[j, i] = B[i, j]
-    else:
-        for i in range(n):
-            for j in range(n):
-                B[i, j] = M[hidden_id[i], hidden_id[j]]
+    level = validation_level()
+    size = np.shape(M)
+    if level != "off":
+        assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
+        assert M.size > 0, "M must not be empty"
+        assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "M must be 2D shape"
+        assert size[0] == size[1], "M must be a square matrix"
+
+        assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
+        assert hidden_id.size > 0, "hidden_id must not be empty"
+        assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
+        assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
+    if level == "full":
+        assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
+        assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
+        assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
+
+    B = block_gather(M, hidden_id, hidden_id, out, view)
 
     return B
 
 
-def block_off_up(M, measure_id, hidden_id):
+def block_off_up(M, measure_id, hidden_id, out=None, view=False):
     '''
     Extract the block matrix from matrix M with row corresponds to measured nodes 
     and column corresponds to hidden nodes
@@ -220,51 +482,51 @@ def block_off_up(M, measure_id, hidden_id):
     1. M:            The original square matrix M
     2. measure_id:   Measured node indices of the original matrix M
     3. hidden_id:    Hidden node indices of the original matrix M
+    4. out:          Preallocated float array to write B to (default: None)
+    5. view:         To return a view of M if measure_id and hidden_id are consecutive ascending ranges (default: False)
 
     Returns:
     1. B:          Block matrix with elements equal to the original matrix
                    formed with row corresponds to measured nodes and column
                    corresponds to hidden nodes
     '''
-    assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
-    assert M.size > 0, "M must not be empty"
-    assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
-    assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
-    size = M.shape
-    assert len(size) == 2, "M must be 2D shape"
-    assert size[0] == size[1], "M must be a square matrix"
-
-    assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
-    assert measure_id.size > 0, "measure_id must not be empty"
-    assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
-    assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
-    assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
-    assert np.max(measure_id) < size[0], "measure_id elements must be smaller than the input matrix size"
-
-    assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
-    assert hidden_id.size > 0, "hidden_id must not be empty"
-    assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
-    assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
-    assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
-    assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
-
+    level = validation_level()
+    size = np.shape(M)
     n_m = len(measure_id)
     n_h = len(hidden_id)
-    assert size[0] == (n_m + n_h), "Total number of elements in measure_id and hidden_id does not equal the number of rows of M"
-
-    all_id = np.unique(np.concatenate((measure_id, hidden_id)))
-    assert len(all_id) == size[0], "mesure_id and hidden_id contain common elements"
-
-    B = np.zeros((n_m, n_h))
-
-    for i in range(n_m):
-        for j in range(n_h):
-            B[i, j] = M[measure_id[i], hidden_id[j]]
+    if level != "off":
+        assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
+        assert M.size > 0, "M must not be empty"
+        assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "M must be 2D shape"
+        assert size[0] == size[1], "M must be a square matrix"
+
+        assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
+        assert measure_id.size > 0, "measure_id must not be empty"
+        assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
+        assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
+
+        assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
+        assert hidden_id.size > 0, "hidden_id must not be empty"
+        assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
+        assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
+
+        assert size[0] == (n_m + n_h), "Total number of elements in measure_id and hidden_id does not equal the number of rows of M"
+    if level == "full":
+        assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
+        assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
+        assert np.max(measure_id) < size[0], "measure_id elements must be smaller than the input matrix size"
+        assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
+        assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
+        all_id = np.unique(np.concatenate((measure_id, hidden_id)))
+        assert len(all_id) == size[0], "mesure_id and hidden_id contain common elements"
+
+    B = block_gather(M, measure_id, hidden_id, out, view)
 
     return B
 
 
-def block_off_low(M, measure_id, hidden_id):
+def block_off_low(M, measure_id, hidden_id, out=None, view=False):
     '''
     Extract the block matrix from matrix M with row corresponds to hidden nodes 
     and column corresponds to measured nodes
@@ -273,46 +535,46 @@ def block_off_low(M, measure_id, hidden_id):
     1. M:            The original square matrix M
     2. measure_id:   Measured node indices of the original matrix M
     3. hidden_id:    Hidden node indices of the original matrix M
+    4. out:          Preallocated float array to write B to (default: None)
+    5. view:         To return a view of M if measure_id and hidden_id are consecutive ascending ranges (default: False)
 
     Returns:
     1. B:          Block matrix with elements equal to the original matrix
                    formed with row corresponds to hidden nodes and column
                    corresponds to column nodes
     '''
-    assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
-    assert M.size > 0, "M must not be empty"
-    assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
-    assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
-    size = M.shape
-    assert len(size) == 2, "M must be 2D shape"
-    assert size[0] == size[1], "M must be a square matrix"
-
-    assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
-    assert measure_id.size > 0, "measure_id must not be empty"
-    assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
-    assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
-    assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
-    assert np.max(measure_id) < size[0], "measure_id elements must be smaller than the input matrix size"
-
-    assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
-    assert hidden_id.size > 0, "hidden_id must not be empty"
-    assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
-    assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
-    assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
-    assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
-
+    level = validation_level()
+    size = np.shape(M)
     n_m = len(measure_id)
     n_h = len(hidden_id)
-    assert size[0] == (n_m + n_h), "Total number of elements in measure_id and hidden_id does not equal the number of rows of M"
-
-    all_id = np.unique(np.concatenate((measure_id, hidden_id)))
-    assert len(all_id) == size[0], "mesure_id and hidden_id contain common elements"
-
-    B = np.zeros((n_h, n_m))
-
-    for i in range(n_h):
-        for j in range(n_m):
-            B[i, j] = M[hidden_id[i], measure_id[j]]
+    if level != "off":
+        assert type(M) == np.ndarray, "M must be of type 'np.ndarray'"
+        assert M.size > 0, "M must not be empty"
+        assert M.dtype == int or M.dtype == float, "M must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "M must be 2D shape"
+        assert size[0] == size[1], "M must be a square matrix"
+
+        assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
+        assert measure_id.size > 0, "measure_id must not be empty"
+        assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
+        assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
+
+        assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
+        assert hidden_id.size > 0, "hidden_id must not be empty"
+        assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
+        assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
+
+        assert size[0] == (n_m + n_h), "Total number of elements in measure_id and hidden_id does not equal the number of rows of M"
+    if level == "full":
+        assert np.isfinite(M).all(), "Elements of M must be finite real numbers"
+        assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
+        assert np.max(measure_id) < size[0], "measure_id elements must be smaller than the input matrix size"
+        assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
+        assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
+        all_id = np.unique(np.concatenate((measure_id, hidden_id)))
+        assert len(all_id) == size[0], "mesure_id and hidden_id contain common elements"
+
+    B = block_gather(M, hidden_id, measure_id, out, view)
 
     return B
 
@@ -348,14 +610,12 @@ def matrix_rearrange(M, measure_id, hidden_id):
                      formed between measure nodes and hidden nodes
     '''
     #NOTE: The functions named block_ below consists of assertion checking
-    #      So we do not intend to add assertions in this function   
-    M_m = block_diag_up(M, measure_id)
-    M_h = block_diag_low(M, hidden_id)
+    #      So we do not intend to add assertions in this function
+    #      The inputs are checked once by block_off_up, the other blocks trust them
     M_u = block_off_up(M, measure_id, hidden_id)
-
-    if np.allclose(M, M.T):
-        M_l = M_u.T
-    else:
+    with validation("off"):
+        M_m = block_diag_up(M, measure_id)
+        M_h = block_diag_low(M, hidden_id)
         M_l = block_off_low(M, measure_id, hidden_id)
 
     # Combine all 4 block matrices
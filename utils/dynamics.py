@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
 import numpy as np
+from scipy import sparse
+from scipy.linalg import solve_continuous_lyapunov
+from scipy.sparse.linalg import eigs, eigsh
+from collections import namedtuple
 import os
 import sys
 
@@ -29,46 +33,259 @@ def inverse_covariance(cov, measure_id, hidden_id):
                           Step 1:   Extract the block matrix of cov from measure_id
                           Step 2:   Invert this block matrix
     '''
-    assert type(cov) == np.ndarray, "cov must be of type 'numpy.ndarray'"
-    assert cov.size > 0, "cov must not be empty"
-    assert cov.dtype == int or cov.dtype == float, "cov must be of dtype 'int' or 'float'"
-    assert np.isfinite(cov).all(), "Elements of cov must be finite real number"
-    size = cov.shape
-    assert len(size) == 2, "cov must be 2D shape"
-    assert size[0] == size[1], "cov must be a square matrix"
-
-    assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
-    assert measure_id.size > 0, "measure_id must not be empty"
-    assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
-    assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
-    assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
-    assert np.max(measure_id) < size[0], "measure_id elements must be smaller than cov size"
-
-    assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
-    assert hidden_id.size > 0, "hidden_id must not be empty"
-    assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
-    assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
-    assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
-    assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
-
+    level = base.validation_level()
+    size = np.shape(cov)
     num_m = len(measure_id)
     num_h = len(hidden_id)
-    assert size[0] == (num_m + num_h), "Total number of elements in measure_id and hidden_id does not equal the number of rows of M"
+    if level != "off":
+        assert type(cov) == np.ndarray, "cov must be of type 'numpy.ndarray'"
+        assert cov.size > 0, "cov must not be empty"
+        assert cov.dtype == int or cov.dtype == float, "cov must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "cov must be 2D shape"
+        assert size[0] == size[1], "cov must be a square matrix"
+
+        assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
+        assert measure_id.size > 0, "measure_id must not be empty"
+        assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
+        assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
+
+        assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
+        assert hidden_id.size > 0, "hidden_id must not be empty"
+        assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
+        assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
 
-    all_id = np.unique(np.concatenate((measure_id, hidden_id)))
-    assert len(all_id) == size[0], "mesure_id and hidden_id contain common elements"
+        assert size[0] == (num_m + num_h), "Total number of elements in measure_id and hidden_id does not equal the number of rows of M"
+    if level == "full":
+        assert np.isfinite(cov).all(), "Elements of cov must be finite real number"
+        assert np.allclose(cov, cov.T), "cov must be symmetric"
+        assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
+        assert np.max(measure_id) < size[0], "measure_id elements must be smaller than cov size"
+        assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
+        assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
+        all_id = np.unique(np.concatenate((measure_id, hidden_id)))
+        assert len(all_id) == size[0], "mesure_id and hidden_id contain common elements"
 
-    # Compute cov_inv_m
-    cov_inv = base.inverse(cov)
-    cov_inv_m = base.block_diag_up(cov_inv, measure_id)
+    # NOTE: The inputs are checked above, so the functions below trust them
+    with base.validation("off"):
+        # Compute cov_inv_m
+        # NOTE: cov is symmetric positive definite, so it is inverted with one Cholesky factorization
+        cov_inv = base.spd_inverse(cov)
+        cov_inv_m = base.block_diag_up(cov_inv, measure_id)
 
-    # Compute cov_m_inv
-    cov_m = base.block_diag_up(cov, measure_id)
-    cov_m_inv = base.inverse(cov_m)
+        # Compute cov_m_inv
+        cov_m = base.block_diag_up(cov, measure_id)
+        cov_m_inv = base.spd_inverse(cov_m)
 
     return cov_inv_m, cov_m_inv
 
 
+class SplitInverse:
+    '''
+    Compute the 2 inverse covariance matrices of inverse_covariance
+    for many splits of the nodes of the same cov into measured and hidden nodes.
+
+    cov is factorized once and its inverse, the precision matrix P, is cached. For each split
+      - cov_inv_m is the block P_mm of P
+      - cov_m_inv is the inverse of the block cov_mm of cov, which is obtained from
+        the Schur complement of P_hh in P
+
+            cov_m_inv = P_mm - P_mh P_hh^-1 P_hm
+
+        if there are fewer hidden nodes than measured nodes, or by inverting cov_mm otherwise
+
+    so each split costs O(min(n, N-n)^3) instead of the O(N^3) of inverse_covariance
+
+    Arguments:
+    1. cov:    Covariance matrix obtained from simulation
+    2. tol:    Tolerance value of condition number (default: 1e5, see spd_inverse in utils/base.py)
+
+    Attributes:
+    1. P:      Precision matrix (inverse of cov)
+    '''
+
+    def __init__(self, cov, tol=1e5):
+        # NOTE: cov and tol are checked in spd_inverse
+        self.cov = cov
+        self.tol = tol
+        self.P = base.spd_inverse(cov, tol)
+
+    def split(self, measure_id, hidden_id):
+        '''
+        Arguments:
+        1. measure_id:      Measured node indices
+        2. hidden_id:       Hidden node indices
+
+        Returns:
+        1. cov_inv_m:       Inverse of covariance matrix without hidden node effect
+        2. cov_m_inv:       Inverse of covariance matrix with hidden node effect
+        '''
+        cov_inv_m, cov_m_inv = self.batch(measure_id[np.newaxis], hidden_id[np.newaxis])
+
+        return cov_inv_m[0], cov_m_inv[0]
+
+    def batch(self, measure_ids, hidden_ids):
+        '''
+        Arguments:
+        1. measure_ids:     Measured node indices of K splits with shape (K, n)
+        2. hidden_ids:      Hidden node indices of K splits with shape (K, N-n)
+
+        Returns:
+        1. cov_inv_m:       Inverse of covariance matrix without hidden node effect of each split with shape (K, n, n)
+        2. cov_m_inv:       Inverse of covariance matrix with hidden node effect of each split with shape (K, n, n)
+        '''
+        level = base.validation_level()
+        N = self.P.shape[0]
+        if level != "off":
+            assert type(measure_ids) == np.ndarray, "measure_ids must be of type 'np.ndarray'"
+            assert measure_ids.dtype == int, "measure_ids must be of dtype 'int'"
+            assert len(measure_ids.shape) == 2 and measure_ids.size > 0, "measure_ids must be non-empty 2D shape"
+
+            assert type(hidden_ids) == np.ndarray, "hidden_ids must be of type 'np.ndarray'"
+            assert hidden_ids.dtype == int, "hidden_ids must be of dtype 'int'"
+            assert len(hidden_ids.shape) == 2 and hidden_ids.size > 0, "hidden_ids must be non-empty 2D shape"
+
+            assert measure_ids.shape[0] == hidden_ids.shape[0], "measure_ids and hidden_ids must have the same number of splits"
+            assert measure_ids.shape[1] + hidden_ids.shape[1] == N, "Total number of elements in measure_id and hidden_id does not equal the number of rows of cov"
+        if level == "full":
+            all_id = np.sort(np.concatenate((measure_ids, hidden_ids), axis=1), axis=1)
+            assert (all_id == np.arange(N)).all(), "measure_id and hidden_id of each split must be a partition of the nodes of cov"
+
+        K, n = measure_ids.shape
+        cov_inv_m = np.empty((K, n, n))
+        cov_m_inv = np.empty((K, n, n))
+
+        # NOTE: The splits are checked above, so the functions below trust them
+        with base.validation("off"):
+            for k in range(K):
+                m = measure_ids[k]
+                h = hidden_ids[k]
+                P_mm = base.block_diag_up(self.P, m, out=cov_inv_m[k])
+
+                if N - n < n:
+                    # Schur complement of P_hh in P, which costs O((N-n)^3 + n^2 (N-n))
+                    P_hh_inv = base.spd_inverse(base.block_diag_low(self.P, h), self.tol)
+                    P_hm = base.block_off_low(self.P, m, h)
+                    S = P_mm - P_hm.T @ (P_hh_inv @ P_hm)
+                    cov_m_inv[k] = 0.5 * (S + S.T)
+                else:
+                    cov_m_inv[k] = base.spd_inverse(base.block_diag_up(self.cov, m), self.tol)
+
+        return cov_inv_m, cov_m_inv
+
+
+def removal_sweep(cov, order, W=None, a=0, refresh=None):
+    '''
+    Sweep the number of measured nodes n by turning the measured nodes into hidden nodes one by one,
+    and yield cov_m_inv of inverse_covariance (and the C matrix of hidden_effect in utils/network.py) of each n.
+
+    Starting from Q = cov^-1 (all nodes measured), removing the node j from the measured nodes
+    is a rank-one downdate (Sherman-Morrison-Woodbury) of the remaining block of Q
+
+        Q' = Q_rr - Q_rj Q_jr / Q_jj
+
+    and adding j to the hidden nodes is a rank-one update of C = E H^-1 E^T with H = Lh + aI,
+
+        s  = (L_jj + a) - b^T H^-1 b,   with b = L_hj
+        w  = E H^-1 b - L_mj
+        C' = C_rr + w w^T / s
+
+    so each step costs O(N^2), and the whole sweep costs about the same as a few inversions of cov
+
+    Arguments:
+    1. cov:        Covariance matrix obtained from simulation
+    2. order:      Node indices in the order of removal from the measured nodes,
+                   the measured nodes keep their order in cov
+    3. W:          Weighted adjacency matrix to also yield the C matrix (default: None)
+    4. a:          Dynamical constant of the C matrix (default: 0)
+    5. refresh:    Number of steps between recomputing cov_m_inv from scratch to bound the
+                   accumulated round-off of the downdates (default: None, i.e. never)
+
+    Yields (for each n = N-1, N-2, ..., N-len(order)):
+    1. measure_id: Measured node indices
+    2. cov_m_inv:  Inverse of covariance matrix with hidden node effect
+    3. C:          C matrix (only if W is given)
+    '''
+    level = base.validation_level()
+    N = np.shape(cov)[0]
+    if level != "off":
+        assert type(order) == np.ndarray, "order must be of type 'np.ndarray'"
+        assert order.dtype == int, "order must be of dtype 'int'"
+        assert len(order.shape) == 1, "order must be 1D shape"
+        assert 0 < order.size < N, "order must have at least one and fewer than N elements"
+        assert W is None or (type(W) == np.ndarray and W.shape == np.shape(cov)), "W must be of type 'numpy.ndarray' with the same shape as cov"
+        assert (type(a) == int or type(a) == float) and np.isfinite(a), "Dynamical constant a must be a real number"
+        assert refresh is None or (type(refresh) == int and refresh > 0), "refresh must be a positive integer"
+    if level == "full":
+        assert (order >= 0).all() and np.max(order) < N, "order elements must be node indices of cov"
+        assert len(np.unique(order)) == order.size, "order must not contain repeated elements"
+        assert W is None or np.allclose(W, W.T), "W must be symmetric\n C matrix currently is defined for bi-directional network only"
+
+    # NOTE: cov and W are checked in spd_inverse and laplacian
+    Q = base.spd_inverse(cov)
+    if W is not None:
+        L = network.laplacian(W).astype(float)
+
+    measure_id = np.arange(N)
+    hidden_id = np.zeros((0,), dtype=int)
+
+    # C matrix and G = E H^-1 of the hidden nodes (none at the beginning)
+    H_inv = np.zeros((0, 0))
+    G = np.zeros((N, 0))
+    C = np.zeros((N, N))
+
+    for step, j in enumerate(order):
+        # NOTE: measure_id stays sorted since the nodes are only removed from it
+        i = np.searchsorted(measure_id, j)
+        keep = np.arange(len(measure_id)) != i
+        measure_id = measure_id[keep]
+
+        # Downdate the inverse of the covariance matrix of the measured nodes
+        if refresh is not None and (step + 1) % refresh == 0:
+            with base.validation("off"):
+                Q = base.spd_inverse(base.block_diag_up(cov, measure_id))
+        else:
+            q = Q[keep, i]
+            Q = Q[np.ix_(keep, keep)] - np.outer(q, q) / Q[i, i]
+
+        if W is None:
+            yield measure_id, Q
+            continue
+
+        # Border H with the new hidden node j, and update H^-1, G and C
+        b = L[hidden_id, j]
+        u = H_inv @ b
+        s = L[j, j] + a - b @ u
+        if not s > 1e-12 * (abs(L[j, j]) + abs(a)):
+            raise base.SingularMatrixError("Lh + aI is singular after removing node %d" % j)
+
+        w = G[keep] @ b - L[measure_id, j]
+        C = C[np.ix_(keep, keep)] + np.outer(w, w) / s
+        G = np.hstack((G[keep] + np.outer(w, u) / s, -w[:, np.newaxis] / s))
+        H_inv = np.block([[H_inv + np.outer(u, u) / s, -u[:, np.newaxis] / s],
+                          [-u[np.newaxis] / s, np.array([[1 / s]])]])
+        hidden_id = np.append(hidden_id, j)
+
+        yield measure_id, Q, C
+
+
+class Stationarity(namedtuple('Stationarity', ['is_stationary', 'min_eig', 'method'])):
+    '''
+    Result of stationary_check, which is truthy if the network is stationary
+
+    Fields:
+    1. is_stationary:  True if it is stationary given noise is weak
+                       False if it is definitely non-stationary
+    2. min_eig:        Smallest (real part of the) eigenvalue of the weighted Laplacian matrix,
+                       or its lower bound if method is "gershgorin"
+    3. method:         "gershgorin" if it is certified by the Gershgorin bound,
+                       "lanczos" (symmetric W) or "arnoldi" (directed W) if the eigenvalue is computed,
+                       or "dense" for a network of fewer than 20 nodes
+    '''
+
+    def __bool__(self):
+        return bool(self.is_stationary)
+
+
 def stationary_check(W, tol=1e-9):
     '''
     Check if the weighted adjaceny matrix fullfils
@@ -77,45 +294,136 @@ def stationary_check(W, tol=1e-9):
     This can be done by verifying if the corresponding
     weighted Laplacian matrix has negative eigenvalues
 
+    The check is done in 2 steps
+      - Gershgorin bound: every eigenvalue of L is not smaller than min_i (L_ii - sum_j |L_ij|),
+        which certifies any network with non-negative weights in O(|E|)
+      - Otherwise only the smallest eigenvalue of the (sparse) L is computed by
+        Lanczos iteration (ARPACK), instead of all eigenvalues of the dense L
+
     Arguments:
-    1. W:               weighted adjacency matrix
+    1. W:               weighted adjacency matrix (dense or scipy.sparse CSR)
 
     2. tol:             tolerance value for verifying the existence of
                         negative eigenvalues (default: 1e-9)
 
     Returns:
-    1. is_stationary:  True if it is stationary given noise is weak
-                       False if it is definitely non-stationary
+    1. result:         Stationarity(is_stationary, min_eig, method), which is truthy if it is stationary
     '''
-    assert type(W) == np.ndarray, "A must be of type 'numpy.ndarray'"
-    assert W.size > 0, "A must not be empty"
-    assert W.dtype == int or W.dtype == float, "A must of dtype 'int' or 'float'"
-    assert np.isfinite(W).all(), "Elements of A must be finite real numbers"
-    size = W.shape
-    assert len(size) == 2, "A must be 2D shape"
-    assert size[0] == size[1], "A must be a square matrix"
-    assert (np.diag(W) == 0).all(), "A must not have self-loop"
+    level = base.validation_level()
+    size = np.shape(W)
+    if level != "off":
+        assert type(W) == np.ndarray or (sparse.issparse(W) and W.format == "csr"), "A must be of type 'numpy.ndarray' or 'scipy.sparse.csr_matrix'"
+        assert min(size) > 0, "A must not be empty"
+        assert W.dtype == int or W.dtype == float, "A must of dtype 'int' or 'float'"
+        assert len(size) == 2, "A must be 2D shape"
+        assert size[0] == size[1], "A must be a square matrix"
 
-    assert (type(tol) == int or type(tol) == float) and tol > 0, "tol must be positive real number"
+        assert (type(tol) == int or type(tol) == float) and tol > 0, "tol must be positive real number"
+    if level == "full":
+        assert np.isfinite(W.data if sparse.issparse(W) else W).all(), "Elements of A must be finite real numbers"
+        assert (W.diagonal() == 0).all(), "A must not have self-loop"
 
-    # Construct the weighted Laplacian matrix
-    L = network.laplacian(W)
+    # NOTE: The inputs are checked above, so the functions below trust them
+    with base.validation("off"):
+        # Construct the weighted Laplacian matrix
+        L = sparse.csr_matrix(network.laplacian(W), dtype=float)
 
-    # Compute the eigenvalues of L
-    eig_vals = base.eigen_values(L)
+    # Gershgorin bound of the smallest (real part of the) eigenvalue
+    # NOTE: Every row of L sums to zero, so the bound is zero if all weights are non-negative
+    diag = L.diagonal()
+    radius = np.asarray(abs(L).sum(1)).ravel() - np.abs(diag)
+    bound = np.min(diag - radius)
+    if bound >= -tol:
+        return Stationarity(True, float(bound), "gershgorin")
 
-    # Check if there are negative eigenvalues
+    # Compute the smallest eigenvalue of L only
     # Note that weighted Laplacian matrix ALWAYS has at least one zero eigenvalue
     # The zero eigenvalues can be negative due to numerical error
-    abs_min_eig_val = min(abs(eig_vals))
+    symmetric = abs(L - L.T).max() <= 1e-12 * abs(L).max()
+    if size[0] < 20:
+        # ARPACK requires the matrix to be larger than the number of Lanczos vectors
+        L = L.toarray()
+        min_eig = np.min(np.linalg.eigvalsh(L)) if symmetric else np.min(np.linalg.eigvals(L).real)
+        method = "dense"
+    elif symmetric:
+        min_eig = eigsh(L, k=1, which='SA', return_eigenvectors=False)[0]
+        method = "lanczos"
+    else:
+        min_eig = eigs(L, k=1, which='SR', return_eigenvectors=False)[0].real
+        method = "arnoldi"
 
-    print("Absolute minimum eigenvalue of L = ", abs_min_eig_val)
-    if abs_min_eig_val < tol:
-        print("The dynamics would probably fluctuate around a stable fixed point")
-        is_stationary = True
+    return Stationarity(bool(min_eig >= -tol), float(min_eig), method)
 
-    else:
-        print("The dynamics would blow up!")
-        is_stationary = False
 
-    return is_stationary
+def lyapunov_covariance(J, noise):
+    '''
+    Compute the stationary covariance matrix of the linearized dynamics
+    around a stable fixed point
+
+        d dX = J dX dt + sqrt(D) dB
+
+    by solving the continuous Lyapunov equation J S + S J^T + D = 0
+
+    Arguments:
+    1. J:         Jacobian matrix of the drift at the fixed point
+    2. noise:     1D array of the noise variance of each variable (the diagonal of D),
+                  e.g. sigma**2 for the noisy x-states and 0 for the other states
+
+    Returns:
+    1. S:         Stationary covariance matrix of all variables
+    '''
+    level = base.validation_level()
+    size = np.shape(J)
+    if level != "off":
+        assert type(J) == np.ndarray, "J must be of type 'numpy.ndarray'"
+        assert J.size > 0, "J must not be empty"
+        assert J.dtype == int or J.dtype == float, "J must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "J must be 2D shape"
+        assert size[0] == size[1], "J must be a square matrix"
+
+        assert type(noise) == np.ndarray, "noise must be of type 'numpy.ndarray'"
+        assert noise.shape == (size[0],), "noise must be 1D shape with the same size as J"
+    if level == "full":
+        assert np.isfinite(J).all(), "Elements of J must be finite real numbers"
+        assert np.isfinite(noise).all() and (noise >= 0).all(), "Elements of noise must be non-negative real numbers"
+
+    # The stationary covariance only exists if the fixed point is stable
+    max_re = np.max(np.linalg.eigvals(J).real)
+    assert max_re < 0, "The fixed point is not stable (max Re(eigenvalue of J) = {})".format(max_re)
+
+    S = solve_continuous_lyapunov(J, -np.diag(noise))
+
+    # Remove the asymmetry due to numerical error
+    S = (S + S.T) / 2
+
+    return S
+
+
+def covariance_distance(cov, cov_ref):
+    '''
+    Distance of a covariance matrix (e.g. estimated from simulation)
+    to a reference covariance matrix (e.g. from lyapunov_covariance)
+
+    Arguments:
+    1. cov:          Covariance matrix
+    2. cov_ref:      Reference covariance matrix
+
+    Returns:
+    1. err_cov:      Relative Frobenius distance of the covariance matrices
+    2. err_inv:      Relative Frobenius distance of the inverse covariance matrices
+    '''
+    level = base.validation_level()
+    if level != "off":
+        assert type(cov) == np.ndarray and type(cov_ref) == np.ndarray, "cov and cov_ref must be of type 'numpy.ndarray'"
+        assert cov.shape == cov_ref.shape, "cov and cov_ref must have the same shape"
+        assert len(cov.shape) == 2 and cov.shape[0] == cov.shape[1], "cov must be a square matrix"
+    if level == "full":
+        assert np.isfinite(cov).all() and np.isfinite(cov_ref).all(), "Elements of cov and cov_ref must be finite real numbers"
+
+    err_cov = np.linalg.norm(cov - cov_ref) / np.linalg.norm(cov_ref)
+
+    cov_inv = np.linalg.inv(cov)
+    cov_ref_inv = np.linalg.inv(cov_ref)
+    err_inv = np.linalg.norm(cov_inv - cov_ref_inv) / np.linalg.norm(cov_ref_inv)
+
+    return err_cov, err_inv
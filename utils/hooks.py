@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+import time
+
+
+def peak_memory():
+    '''
+    Peak resident memory of the current process
+
+    Returns:
+    1. peak:     Peak resident memory in MB, or None if it is not available on the platform
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # NOTE: ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def next_event(t, inter, sample_start, T):
+    '''
+    Next integration step after t at which simulate() calls the hook,
+    i.e. the next multiple of inter, or sample_start where the sampling phase begins
+
+    Arguments:
+    1. t:              Current integration step
+    2. inter:          Number of integration steps between two reports (None for no report)
+    3. sample_start:   Time step to start sampling
+    4. T:              Total number of iteration
+
+    Returns:
+    1. t_event:        Next step to call the hook at (T if there is none)
+    '''
+    t_event = T if inter is None else min(T, (t // inter + 1) * inter)
+    if t < sample_start < t_event:
+        t_event = sample_start
+
+    return t_event
+
+
+class Hook:
+    '''
+    Instrumentation interface of simulate() in utils/sde.py.
+    This base class does nothing, subclasses override the methods they need.
+
+    simulate() calls
+      - begin(t_start, T) once before the integration
+      - phase(name, t) at the beginning of each phase, "burn-in", "sampling" and "finalize"
+      - update(t, samples) every inter integration steps (and at the beginning of the sampling phase)
+      - end(t, samples) once after the finalize phase
+
+    If no hook is given, simulate() never calls a hook in the integration loop
+
+    Arguments:
+    1. inter:    Number of integration steps between two calls of update (default: None, i.e. never)
+    '''
+
+    def __init__(self, inter=None):
+        assert inter is None or (type(inter) == int and inter > 0), "inter must be a positive integer"
+
+        self.inter = inter
+
+    def begin(self, t_start, T):
+        pass
+
+    def phase(self, name, t):
+        pass
+
+    def update(self, t, samples):
+        pass
+
+    def end(self, t, samples):
+        pass
+
+
+class ProgressHook(Hook):
+    '''
+    Show the progress of the integration with a tqdm progress bar,
+    which is only refreshed every inter integration steps
+
+    Arguments:
+    1. inter:    Number of integration steps between two refreshes (default: 10000)
+    '''
+
+    def __init__(self, inter=10000):
+        super().__init__(inter)
+        self.bar = None
+
+    def begin(self, t_start, T):
+        from tqdm import tqdm
+
+        self.bar = tqdm(total=T, initial=t_start)
+        self.t = t_start
+
+    def update(self, t, samples):
+        self.bar.update(t - self.t)
+        self.bar.set_postfix(samples=samples)
+        self.t = t
+
+    def end(self, t, samples):
+        self.update(t, samples)
+        self.bar.close()
+
+
+class MetricsHook(Hook):
+    '''
+    Record machine-readable metrics of a simulation, i.e. the integration speed (steps/sec),
+    the number of samples collected, the elapsed time of each phase and the peak memory
+
+    Arguments:
+    1. inter:      Number of integration steps between two records of the history (default: 100000)
+    2. verbose:    To print each record as a line of JSON (default: False)
+
+    Attributes (after the simulation):
+    1. history:    List of records (dict) of step, samples, elapsed time, recent steps/sec and peak memory
+    2. phases:     Elapsed time (in seconds) of each phase
+    '''
+
+    def __init__(self, inter=100000, verbose=False):
+        super().__init__(inter)
+        assert type(verbose) == bool, "verbose must be boolean"
+
+        self.verbose = verbose
+        self.history = []
+        self.phases = {}
+        self.steps = 0
+        self.samples = 0
+        self.elapsed = None
+
+    def begin(self, t_start, T):
+        # NOTE: The metrics of a previous run with the same hook are discarded
+        self.history = []
+        self.phases = {}
+        self.steps = 0
+        self.samples = 0
+
+        self.t_start = t_start
+        self.start_time = time.perf_counter()
+        self.current = None
+
+        self.last_t = t_start
+        self.last_time = self.start_time
+
+    def phase(self, name, t):
+        now = time.perf_counter()
+        if self.current is not None:
+            self.phases[self.current] = self.phases.get(self.current, 0) + now - self.phase_time
+
+        self.current = name
+        self.phase_time = now
+
+    def update(self, t, samples):
+        now = time.perf_counter()
+        rate = (t - self.last_t) / (now - self.last_time) if now > self.last_time else None
+
+        record = dict(step=t, samples=samples, elapsed=now - self.start_time,
+                      steps_per_sec=rate, peak_memory_mb=peak_memory())
+        self.history.append(record)
+        if self.verbose:
+            print(json.dumps(record))
+
+        self.last_t = t
+        self.last_time = now
+
+    def end(self, t, samples):
+        self.phase(None, t)
+        self.steps = t - self.t_start
+        self.samples = samples
+        self.elapsed = time.perf_counter() - self.start_time
+
+    def metrics(self):
+        '''
+        Returns:
+        1. metrics:   Dictionary of the summary and the history of the metrics
+        '''
+        integrate_time = self.phases.get("burn-in", 0) + self.phases.get("sampling", 0)
+
+        return dict(steps=self.steps,
+                    samples=self.samples,
+                    steps_per_sec=self.steps / integrate_time if integrate_time > 0 else None,
+                    elapsed=self.elapsed,
+                    phases=dict(self.phases),
+                    peak_memory_mb=peak_memory(),
+                    history=self.history)
+
+    def to_json(self, path=None):
+        '''
+        Export the metrics as JSON
+
+        Arguments:
+        1. path:     File path to write the JSON to (default: None, i.e. only return it)
+
+        Returns:
+        1. text:     Metrics in JSON
+        '''
+        text = json.dumps(self.metrics(), indent=2)
+
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+
+        return text
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from scipy import sparse
+
+# Numba is optional, the simulations fall back to NumPy without it
+try:
+    import numba
+    HAS_NUMBA = True
+except ImportError:
+    numba = None
+    HAS_NUMBA = False
+
+
+def csr_arrays(M, dtype=float):
+    '''
+    Convert a (dense or sparse) matrix into the CSR arrays used by the compiled drifts
+
+    Arguments:
+    1. M:         Square matrix (dense or scipy.sparse)
+    2. dtype:     Data type of the nonzero elements (default: float)
+
+    Returns:
+    1. indptr:    Row pointer (int64)
+    2. indices:   Column indices (int64)
+    3. data:      Nonzero elements
+    '''
+    M = sparse.csr_matrix(M, dtype=dtype)
+    M.eliminate_zeros()
+
+    return M.indptr.astype(np.int64), M.indices.astype(np.int64), M.data.copy()
+
+
+def logistic_drift(state, out, params):
+    '''
+    Compiled drift of the logistic dynamics with diffusive coupling
+    (see logistic_drift in gen_cov/logistic_diffusive.py)
+
+    Arguments:
+    1. state:    State of all nodes with shape (1, N)
+    2. out:      Array of the same shape as state to write d state / dt to
+    3. params:   Tuple (indptr, indices, data, r) with the CSR arrays of the Laplacian matrix
+    '''
+    indptr, indices, data, r = params
+    N = state.shape[1]
+
+    for i in range(N):
+        Lx = 0.0
+        for p in range(indptr[i], indptr[i+1]):
+            Lx += data[p] * state[0, indices[p]]
+
+        x = state[0, i]
+        out[0, i] = r*x*(1 - x) - Lx
+
+
+def fhn_drift(state, out, params):
+    '''
+    Compiled drift of the FHN dynamics with diffusive coupling along the x state
+    (see fhn_drift in gen_cov/fhn_diffusive.py)
+
+    Arguments:
+    1. state:    State of all nodes with shape (2, N)
+    2. out:      Array of the same shape as state to write d state / dt to
+    3. params:   Tuple (indptr, indices, data, epsilon, alpha) with the CSR arrays of the Laplacian matrix
+    '''
+    indptr, indices, data, epsilon, alpha = params
+    N = state.shape[1]
+
+    for i in range(N):
+        Lx = 0.0
+        for p in range(indptr[i], indptr[i+1]):
+            Lx += data[p] * state[0, indices[p]]
+
+        x = state[0, i]
+        y = state[1, i]
+        out[0, i] = (x - x*x*x/3 - y)/epsilon - Lx
+        out[1, i] = x + alpha
+
+
+def rossler_drift(state, out, params):
+    '''
+    Compiled drift of the Rossler dynamics with tanh diffusive coupling
+    (see rossler_drift in gen_cov/rossler_tanh.py)
+
+    Arguments:
+    1. state:    State of all nodes with shape (3, N)
+    2. out:      Array of the same shape as state to write d state / dt to
+    3. params:   Tuple (indptr, cols, weights, c1, c2, c3) with the edge list of W grouped by row
+                 (the row pointer, column indices and weights of W in CSR format)
+    '''
+    indptr, cols, weights, c1, c2, c3 = params
+    N = state.shape[1]
+
+    for i in range(N):
+        cx = 0.0
+        cy = 0.0
+        cz = 0.0
+        for p in range(indptr[i], indptr[i+1]):
+            j = cols[p]
+            cx += weights[p] * np.tanh(state[0, j] - state[0, i])
+            cy += weights[p] * np.tanh(state[1, j] - state[1, i])
+            cz += weights[p] * np.tanh(state[2, j] - state[2, i])
+
+        x = state[0, i]
+        y = state[1, i]
+        z = state[2, i]
+        out[0, i] = -y - z + cx
+        out[1, i] = x + c1*y + cy
+        out[2, i] = c2 + z*(x - c3) + cz
+
+
+DRIFTS = {"logistic": logistic_drift, "fhn": fhn_drift, "rossler": rossler_drift}
+
+
+def logistic_params(L, r, dtype=float):
+    '''
+    Extra arguments of logistic_drift
+
+    Arguments:
+    1. L:        Weighted Laplacian matrix (dense or sparse)
+    2. r:        Parameter of f(x)
+    3. dtype:    Data type of the nonzero elements of L (default: float)
+    '''
+    return csr_arrays(L, dtype) + (float(r),)
+
+
+def fhn_params(L, epsilon, alpha, dtype=float):
+    '''
+    Extra arguments of fhn_drift
+
+    Arguments:
+    1. L:         Weighted Laplacian matrix (dense or sparse)
+    2. epsilon:   FHN parameter
+    3. alpha:     FHN parameter
+    4. dtype:     Data type of the nonzero elements of L (default: float)
+    '''
+    return csr_arrays(L, dtype) + (float(epsilon), float(alpha))
+
+
+def rossler_params(W, c1, c2, c3, dtype=float):
+    '''
+    Extra arguments of rossler_drift, the edges of W are grouped by row in CSR format
+
+    Arguments:
+    1. W:           Weighted adjacency matrix (dense or sparse)
+    2. c1, c2, c3:  Rossler parameters
+    3. dtype:       Data type of the weights (default: float)
+    '''
+    return csr_arrays(W, dtype) + (float(c1), float(c2), float(c3))
+
+
+# The extra arguments of the compiled drifts are only built if the compiled loop is used
+PARAMS = {"logistic": logistic_params, "fhn": fhn_params, "rossler": rossler_params}
+
+
+def make_integrate(drift):
+    '''
+    Build the integration loop of simulate() in utils/sde.py around a compiled drift
+
+    Returns:
+    1. integrate:   Function advancing the state by many steps in one call (see below)
+    '''
+    def integrate(state, params, noise, j, noise_std, int_dt, heun, t, t_stop,
+                  sample_inter, sample_start, observe, X, k_stop, F, ts):
+        '''
+        Advance the state from step t until step t_stop, the noise buffer is used up,
+        or k_stop samples have been collected
+
+        Arguments:
+        1. state:          State with shape (d, N), updated in place
+        2. params:         Tuple of extra arguments passed to drift
+        3. noise:          Buffer of the pre-drawn noise with shape (noise_block, N)
+        4. j:              Index of the next unused noise in the buffer
+        5. noise_std:      Standard deviation of the noise increment of each step
+        6. int_dt:         Integration time step
+        7. heun:           To use the stochastic Heun scheme instead of Euler-Maruyama
+        8. t:              Current integration step
+        9. t_stop:         Integration step to stop at
+        10. sample_inter:  Sampling interval in integration steps
+        11. sample_start:  Time step to start sampling
+        12. observe:       Indices of the nodes whose x-state is sampled
+        13. X:             Block of sampled x-states with shape (K, n)
+        14. k_stop:        Number of samples to collect before returning (not greater than K)
+        15. F:             Block of sampled states with shape (K, d, N), or (0, d, N) not to record them
+        16. ts:            Sampled time series of the first node, or shape (d, 0) not to record it
+
+        Returns:
+        1. t:         Integration step to continue from
+        2. j:         Index of the next unused noise in the buffer
+        3. k:         Number of samples written to X (and F)
+        4. status:    0 on success, -1 if the dynamics blows up
+        '''
+        d, N = state.shape
+        f0 = np.empty_like(state)
+        f1 = np.empty_like(state)
+        pred = np.empty_like(state)
+        k = 0
+
+        while t < t_stop and j < noise.shape[0]:
+            eta = noise[j]
+            j += 1
+
+            drift(state, f0, params)
+            if heun:
+                for a in range(d):
+                    for i in range(N):
+                        pred[a, i] = state[a, i] + f0[a, i] * int_dt
+                for i in range(N):
+                    pred[0, i] += noise_std*eta[i]
+                drift(pred, f1, params)
+                for a in range(d):
+                    for i in range(N):
+                        ds = 0.5 * (f0[a, i] + f1[a, i]) * int_dt
+                        if a == 0:
+                            ds += noise_std*eta[i]
+                        state[a, i] += ds
+            else:
+                for a in range(d):
+                    for i in range(N):
+                        ds = f0[a, i] * int_dt
+                        if a == 0:
+                            ds += noise_std*eta[i]
+                        state[a, i] += ds
+
+            # Sample the node states
+            if t % sample_inter == 0:
+                for a in range(d):
+                    for i in range(N):
+                        if not np.isfinite(state[a, i]):
+                            return t, j, k, -1
+
+                if ts.shape[1] > 0:
+                    for a in range(d):
+                        ts[a, t // sample_inter] = state[a, 0]
+
+                if t >= sample_start:
+                    for m in range(observe.shape[0]):
+                        X[k, m] = state[0, observe[m]]
+                    if F.shape[0] > 0:
+                        F[k] = state
+                    k += 1
+
+                    if k == k_stop:
+                        return t + 1, j, k, 0
+
+            t += 1
+
+        return t, j, k, 0
+
+    return integrate
+
+
+# Compiled integration loops, compiled once per model on first use
+KERNELS = {}
+
+
+def kernel(name):
+    '''
+    Compiled integration loop of a model (see make_integrate)
+
+    Arguments:
+    1. name:     Name of the model, "logistic", "fhn" or "rossler"
+
+    Returns:
+    1. integrate:   Compiled integration loop
+    '''
+    assert HAS_NUMBA, "numba is not installed"
+    assert name in DRIFTS, "name must be 'logistic', 'fhn' or 'rossler'"
+
+    if name not in KERNELS:
+        drift = numba.njit(DRIFTS[name])
+        KERNELS[name] = numba.njit(make_integrate(drift))
+
+    return KERNELS[name]
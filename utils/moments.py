@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from scipy.linalg import get_blas_funcs
+from collections import namedtuple
+
+
+class MomentAccumulator:
+    '''
+    Accumulate the mean and covariance matrix of a stream of state vectors.
+
+    The samples are buffered into a (K, N) block. Once the block is full,
+    it is folded into the centered 2nd moment with one symmetric rank-K update (BLAS syrk)
+    and merged with the running moments by the pairwise (Chan et al.) update:
+
+        n     = n_a + n_b
+        delta = mean_b - mean_a
+        mean  = mean_a + delta * n_b / n
+        M2    = M2_a + M2_b + outer(delta, delta) * n_a * n_b / n
+
+    Since the moments are always centered, this does not lose precision
+    like the naive E[xx] - E[x]E[x] when the states fluctuate around a large mean.
+
+    Arguments:
+    1. N:         Number of variables (length of each state vector)
+    2. block:     Number of samples K buffered before each rank-K update (default: 128)
+    3. dtype:     Data type of the accumulated moments (default: float)
+    '''
+
+    def __init__(self, N, block=128, dtype=float):
+        assert type(N) == int and N > 0, "N must be a positive integer"
+        assert type(block) == int and block > 0, "block must be a positive integer"
+
+        self.N = N
+        self.block = block
+        self.dtype = np.dtype(dtype)
+
+        # Number of folded samples, their mean and centered 2nd moment
+        # NOTE: M2 is Fortran ordered such that syrk updates it in place,
+        #       and only its upper triangle is kept up to date
+        self.count = 0
+        self.m_01 = np.zeros((N,), dtype=self.dtype)
+        self.M2 = np.zeros((N, N), dtype=self.dtype, order='F')
+
+        # Buffer of samples. The extra row is reserved for the mean correction
+        # such that each fold is a single rank-(K+1) update
+        self.buffer = np.zeros((block + 1, N), dtype=self.dtype)
+        self.k = 0
+
+    def push(self, x):
+        '''
+        Add one sample (state vector of shape (N,)) to the accumulator
+        '''
+        self.buffer[self.k] = x
+        self.k += 1
+
+        if self.k == self.block:
+            self.fold()
+
+    def push_block(self, X):
+        '''
+        Add a block of samples (array of shape (K, N)) to the accumulator.
+        The samples are folded at the same boundaries as pushing them one by one,
+        so the moments are bitwise identical
+        '''
+        i = 0
+        while i < X.shape[0]:
+            m = min(self.block - self.k, X.shape[0] - i)
+            self.buffer[self.k:self.k+m] = X[i:i+m]
+            self.k += m
+            i += m
+
+            if self.k == self.block:
+                self.fold()
+
+    def __len__(self):
+        '''
+        Number of pushed samples, including the buffered ones
+        '''
+        return self.count + self.k
+
+    def fold(self):
+        '''
+        Fold the buffered samples into the running moments
+        '''
+        k = self.k
+        if k == 0:
+            return
+
+        n = self.count
+        B = self.buffer[:k+1]
+
+        # Center the block around its own mean
+        mean_b = np.mean(B[:k], 0)
+        B[:k] -= mean_b
+
+        # Mean correction of the pairwise update as an extra row of the block
+        delta = mean_b - self.m_01
+        B[k] = np.sqrt(n * k / (n + k)) * delta
+
+        # M2 += B^T B (upper triangle only)
+        # NOTE: B.T is Fortran contiguous, so no copy is made by BLAS
+        syrk = get_blas_funcs('syrk', (self.M2,))
+        self.M2 = syrk(1.0, B.T, beta=1.0, c=self.M2, trans=0, lower=0, overwrite_c=1)
+
+        self.m_01 += delta * k / (n + k)
+        self.count = n + k
+        self.k = 0
+
+    def merge(self, other):
+        '''
+        Merge the moments of another MomentAccumulator into this one
+
+        Arguments:
+        1. other:    MomentAccumulator of the same number of variables
+
+        Returns:
+        1. self:     This accumulator after merging
+        '''
+        assert isinstance(other, MomentAccumulator), "other must be of type 'MomentAccumulator'"
+        assert other.N == self.N, "other must have the same number of variables"
+
+        self.fold()
+        other.fold()
+
+        n_a = self.count
+        n_b = other.count
+        if n_b == 0:
+            return self
+
+        n = n_a + n_b
+        delta = other.m_01 - self.m_01
+
+        self.M2 += other.M2 + np.outer(delta, delta) * (n_a * n_b / n)
+        self.m_01 += delta * n_b / n
+        self.count = n
+
+        return self
+
+    def mean(self):
+        '''
+        Returns:
+        1. m_01:     Mean of all pushed samples
+        '''
+        self.fold()
+
+        return self.m_01.copy()
+
+    def cov(self):
+        '''
+        Returns:
+        1. cov:      (Population) covariance matrix of all pushed samples
+        '''
+        self.fold()
+        assert self.count > 0, "No samples have been pushed"
+
+        M2 = np.triu(self.M2)
+        cov = (M2 + np.triu(M2, 1).T) / self.count
+
+        return cov
+
+
+# Equal-time covariance matrix and time-lagged covariance matrices of a LagAccumulator
+# - cov:       Equal-time covariance matrix with shape (N, N)
+# - lags:      Time lags in number of samples with shape (L,)
+# - cov_lag:   Lagged covariance matrices K(tau) = E[(x(t) - mean)(x(t - tau) - mean)^T] with shape (L, N, N)
+# - count:     Number of samples
+LaggedCovariance = namedtuple('LaggedCovariance', ['cov', 'lags', 'cov_lag', 'count'])
+
+
+class LagAccumulator(MomentAccumulator):
+    '''
+    Accumulate the equal-time and time-lagged covariance matrices of a stream of state vectors in a single pass.
+
+    The equal-time moments are accumulated as in MomentAccumulator. In addition, the samples are
+    kept in a buffer together with the last max(lags) samples of the previous blocks (ring buffer),
+    and each full block is folded into the lagged cross moments with one matrix product per lag
+
+        S(tau) += X(t)^T X(t - tau)
+
+    All samples are shifted by the first sample before the products,
+    such that the cross moments do not lose precision if the states fluctuate around a large mean.
+    Pairs straddling two merged accumulators are not counted.
+
+    Arguments:
+    1. N:         Number of variables (length of each state vector)
+    2. lags:      Time lags in number of samples (positive integers)
+    3. block:     Number of samples K buffered before each update (default: 128)
+    4. dtype:     Data type of the accumulated moments (default: float)
+    '''
+
+    def __init__(self, N, lags, block=128, dtype=float):
+        super().__init__(N, block, dtype)
+
+        lags = np.asarray(lags)
+        assert lags.size > 0 and lags.ndim == 1, "lags must be a non-empty 1D sequence"
+        assert np.issubdtype(lags.dtype, np.integer) and (lags > 0).all(), "lags must be positive integers"
+        assert len(np.unique(lags)) == lags.size, "lags must not contain repeated elements"
+
+        self.lags = lags.astype(int)
+        self.max_lag = int(lags.max())
+        L = lags.size
+
+        # Cross moments, sums of x(t) and x(t - tau), and number of pairs of each lag
+        self.S = np.zeros((L, N, N), dtype=self.dtype)
+        self.s_a = np.zeros((L, N), dtype=self.dtype)
+        self.s_b = np.zeros((L, N), dtype=self.dtype)
+        self.pairs = np.zeros((L,), dtype=int)
+
+        # Shifted samples, the first max_lag rows hold the end of the previous blocks
+        # NOTE: filled is the number of valid rows of history at the beginning of the current block
+        self.shift = np.zeros((N,), dtype=self.dtype)
+        self.history = np.zeros((self.max_lag + block, N), dtype=self.dtype)
+        self.filled = 0
+
+    def push(self, x):
+        '''
+        Add one sample (state vector of shape (N,)) to the accumulator
+        '''
+        if len(self) == 0:
+            self.shift[:] = x
+        self.history[self.max_lag + self.k] = x - self.shift
+
+        super().push(x)
+
+    def push_block(self, X):
+        '''
+        Add a block of samples (array of shape (K, N)) to the accumulator
+        '''
+        i = 0
+        while i < X.shape[0]:
+            if len(self) == 0:
+                self.shift[:] = X[i]
+
+            # Fill the history up to the end of the current block before folding
+            m = min(self.block - self.k, X.shape[0] - i)
+            self.history[self.max_lag+self.k:self.max_lag+self.k+m] = X[i:i+m] - self.shift
+            super().push_block(X[i:i+m])
+            i += m
+
+    def fold(self):
+        '''
+        Fold the buffered samples into the running equal-time and lagged moments
+        '''
+        k = self.k
+        if k == 0:
+            return
+
+        H = self.history
+        m = self.max_lag
+        A = H[m:m+k]
+
+        for i, lag in enumerate(self.lags):
+            # Skip the samples whose lagged partner is not available
+            start = max(0, lag - self.filled)
+            if start >= k:
+                continue
+            B = H[m+start-lag:m+k-lag]
+
+            self.S[i] += A[start:].T @ B
+            self.s_a[i] += A[start:].sum(0)
+            self.s_b[i] += B.sum(0)
+            self.pairs[i] += k - start
+
+        # Keep the last max_lag samples for the next block
+        H[:m] = H[k:k+m].copy()
+        self.filled = min(m, self.filled + k)
+
+        super().fold()
+
+    def merge(self, other):
+        '''
+        Merge the moments of another LagAccumulator of the same lags into this one
+
+        Arguments:
+        1. other:    LagAccumulator of the same number of variables and lags
+
+        Returns:
+        1. self:     This accumulator after merging
+        '''
+        assert isinstance(other, LagAccumulator), "other must be of type 'LagAccumulator'"
+        assert np.array_equal(other.lags, self.lags), "other must have the same lags"
+
+        self.fold()
+        other.fold()
+
+        # NOTE: An empty accumulator takes over the shift of other
+        if len(self) == 0 and self.pairs.sum() == 0:
+            self.shift[:] = other.shift
+
+        # Move the cross moments of other to the shift of this accumulator
+        # sum (a + d)(b + d)^T = S + s_a d^T + d s_b^T + n d d^T
+        d = other.shift - self.shift
+        for i in range(self.lags.size):
+            n = other.pairs[i]
+            self.S[i] += other.S[i] + np.outer(other.s_a[i], d) + np.outer(d, other.s_b[i]) + n * np.outer(d, d)
+            self.s_a[i] += other.s_a[i] + n * d
+            self.s_b[i] += other.s_b[i] + n * d
+        self.pairs += other.pairs
+
+        return super().merge(other)
+
+    def cov_lag(self):
+        '''
+        Returns:
+        1. cov_lag:  Lagged covariance matrices K(tau) with shape (L, N, N)
+                     (NaN if there is no pair of a lag)
+                     NOTE: Both x(t) and x(t - tau) are centered on the mean of all samples,
+                           not on the means of their own windows
+        '''
+        # Mean of all samples relative to the shift of the cross moments
+        # sum (a - mu)(b - mu)^T = S - s_a mu^T - mu s_b^T + n mu mu^T
+        mu = self.mean() - self.shift
+
+        cov_lag = np.full(self.S.shape, np.nan)
+        for i in range(self.lags.size):
+            n = self.pairs[i]
+            if n > 0:
+                cov_lag[i] = (self.S[i] - np.outer(self.s_a[i], mu) - np.outer(mu, self.s_b[i])) / n + np.outer(mu, mu)
+
+        return cov_lag
+
+    def lagged(self):
+        '''
+        Returns:
+        1. result:   LaggedCovariance of all pushed samples
+        '''
+        return LaggedCovariance(self.cov(), self.lags.copy(), self.cov_lag(), self.count)
+
+
+class ConvergenceMonitor:
+    '''
+    Monitor the convergence of the covariance matrix of a running simulation,
+    such that the simulation stops once the statistic of convergence is below tol
+    (see the option convergence of simulate in utils/sde.py)
+
+    Every check_inter samples, the running moments are snapshot and one of the statistics is computed
+      - "precision":   Relative change of the off-diagonal elements (upper triangle) of the
+                       precision matrix (inverse of cov) since the last check,
+                           || p - p_last || / || p_last ||
+      - "edges":       Fraction of node pairs whose link changed since the last check,
+                       where the network is reconstructed from the precision matrix by reconstruct.kmeans
+                       (tol=0 requires an identical edge set)
+
+    Arguments:
+    1. tol:           Tolerance of the statistic
+    2. check_inter:   Number of samples between two checks (default: 10000)
+    3. criterion:     "precision" or "edges" (default: "precision")
+    4. patience:      Number of consecutive checks with the statistic not greater than tol
+                      before stopping (default: 1)
+
+    Attributes (after the simulation):
+    1. samples:       Number of samples used, i.e. the number of samples when it converged,
+                      or None if it did not converge
+    2. history:       List of (number of samples, statistic) of all checks
+    '''
+
+    def __init__(self, tol, check_inter=10000, criterion="precision", patience=1):
+        assert (type(tol) == int or type(tol) == float) and np.isfinite(tol) and tol >= 0, "tol must be a non-negative real number"
+        assert type(check_inter) == int and check_inter > 0, "check_inter must be a positive integer"
+        assert criterion in ("precision", "edges"), "criterion must be 'precision' or 'edges'"
+        assert type(patience) == int and patience > 0, "patience must be a positive integer"
+
+        self.tol = tol
+        self.check_inter = check_inter
+        self.criterion = criterion
+        self.patience = patience
+
+        self.samples = None
+        self.history = []
+        self.last = None
+        self.passed = 0
+
+    def statistic(self, cov):
+        '''
+        Compute the statistic of convergence of cov against the last check
+
+        Returns:
+        1. stat:     Statistic of convergence (inf at the first check)
+        '''
+        # NOTE: Imported here since reconstruct depends on utils
+        from utils import base
+
+        # NOTE: cov is accumulated here, so the functions below trust it
+        with base.validation("off"):
+            p = base.off_diag_upper(np.linalg.inv(cov))
+
+            if self.criterion == "edges":
+                from reconstruct import kmeans
+                current = base.off_diag_upper(kmeans(p, cov.shape[0]))
+            else:
+                current = p
+
+        if self.last is None:
+            stat = np.inf
+        elif self.criterion == "edges":
+            stat = np.count_nonzero(current != self.last) / current.size
+        else:
+            stat = np.linalg.norm(current - self.last) / np.linalg.norm(self.last)
+
+        self.last = current
+
+        return stat
+
+    def check(self, acc):
+        '''
+        Check the convergence of the running moments
+
+        Arguments:
+        1. acc:      List of MomentAccumulator (one per replica), their samples are pooled
+
+        Returns:
+        1. converged:   True if the simulation can stop
+        '''
+        pool = MomentAccumulator(acc[0].N)
+        for a in acc:
+            pool.merge(a)
+        count = len(pool)
+
+        # The sample covariance matrix is singular with fewer samples than variables
+        if count <= pool.N:
+            return False
+
+        stat = self.statistic(pool.cov())
+        self.history.append((count, stat))
+
+        self.passed = self.passed + 1 if stat <= self.tol else 0
+        if self.passed >= self.patience:
+            self.samples = count
+            return True
+
+        return False
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import eigsh
 import os
 import sys
 
@@ -9,33 +11,85 @@ sys.path.append(ROOT_DIR)
 from utils import base
 
 
-def laplacian(W):
+def laplacian(W, dtype=None):
     '''
     Construct the (weighted) Laplacian matrix from the (weighted) adjacnecy matrix
 
     Arguments:
-    1. W:    weighted adjacency matrix
+    1. W:        weighted adjacency matrix (dense or scipy.sparse CSR)
+    2. dtype:    Data type of L, e.g. np.float32 to halve the memory traffic of L @ x
+                 (default: None, i.e. that of W)
 
     Returns:
     1. L:    weighted Laplacian matrix
+             (in CSR format if W is sparse, such that L @ x costs O(|E|))
     '''
-    assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray'"
-    assert W.size > 0, "W must not be empty"
-    assert W.dtype == int or W.dtype == float, "W must be of dtype 'int' or 'float'"
-    assert np.isfinite(W).all(), "Elements of W must be finite real numbers"
-    size = W.shape
-    assert len(size) == 2, "W must be 2D shape"
-    assert size[0] == size[1], "W must be a square matrix"
-    assert (np.diag(W) == 0).all(), "W must not have self-loop"
+    level = base.validation_level()
+    if sparse.issparse(W):
+        if level != "off":
+            assert W.format == "csr", "sparse W must be in CSR format"
+        W_data = W.data
+    else:
+        if level != "off":
+            assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray' or 'scipy.sparse.csr_matrix'"
+        W_data = W
+    size = np.shape(W)
+    if level != "off":
+        assert min(W.shape) > 0, "W must not be empty"
+        assert W.dtype == int or W.dtype == float, "W must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "W must be 2D shape"
+        assert size[0] == size[1], "W must be a square matrix"
+        assert dtype is None or np.dtype(dtype) in (np.float32, np.float64), "dtype must be None, 'float32' or 'float64'"
+    if level == "full":
+        assert np.isfinite(W_data).all(), "Elements of W must be finite real numbers"
+        assert (W.diagonal() == 0).all(), "W must not have self-loop"
 
     # Construct the (weighted) Laplacian matrix
     # NOTE: Be-careful when W is a directed network
     #       in-link and out-link can be different
-    L = np.diag(np.sum(W, 1)) - W
+    if sparse.issparse(W):
+        degree = np.asarray(W.sum(1)).ravel()
+        L = sparse.csr_matrix(sparse.diags(degree.astype(float)) - W)
+    else:
+        L = np.diag(np.sum(W, 1)) - W
+
+    # NOTE: The degrees are summed in the precision of W before casting
+    if dtype is not None:
+        L = L.astype(dtype)
 
     return L
 
 
+def spectral_radius(L, tol=1e-3):
+    '''
+    Estimate the spectral radius (largest absolute eigenvalue) of a symmetric matrix
+    such as the weighted Laplacian matrix, using Lanczos iteration (ARPACK)
+    instead of a full eigendecomposition. Only matrix-vector products with L are needed,
+    which cost O(|E|) if L is sparse
+
+    Arguments:
+    1. L:       Symmetric matrix (dense or scipy.sparse)
+    2. tol:     Relative tolerance of the estimate (default: 1e-3)
+
+    Returns:
+    1. rho:     Spectral radius of L
+    '''
+    assert type(L) == np.ndarray or sparse.issparse(L), "L must be of type 'numpy.ndarray' or scipy.sparse matrix"
+    size = L.shape
+    assert len(size) == 2, "L must be 2D shape"
+    assert size[0] == size[1] and size[0] > 0, "L must be a non-empty square matrix"
+    assert (type(tol) == int or type(tol) == float) and tol > 0, "tol must be a positive real number"
+
+    # ARPACK requires the matrix to be larger than the number of Lanczos vectors
+    if size[0] < 20:
+        L = L.toarray() if sparse.issparse(L) else L
+        return np.max(np.abs(np.linalg.eigvalsh(L)))
+
+    eig_vals = eigsh(L.astype(float), k=1, which='LM', tol=tol, return_eigenvectors=False)
+
+    return abs(eig_vals[0])
+
+
 def hidden_effect(W, measure_id, hidden_id, a=0):
     '''
     Compute hidden node effect (C matrix)
@@ -49,52 +103,127 @@ def hidden_effect(W, measure_id, hidden_id, a=0):
     Returns:
     1. C:       C matrix
     '''
-    assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray'"
-    assert W.size > 0, "W must not be empty"
-    assert W.dtype == int or W.dtype == float, "W must be of dtype 'int' or 'float'"
-    assert np.isfinite(W).all(), "Elements of W must be finite real numbers"
-    size = W.shape
-    assert len(size) == 2, "W must be 2D shape"
-    assert size[0] == size[1], "W must be a square matrix"
-    assert (np.diag(W) == 0).all(), "W must not have self-loop"
-    assert np.allclose(W, W.T), "W must be symmetric\n C matrix currently is defined for bi-directional network only"
-
-    assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
-    assert measure_id.size > 0, "measure_id must not be empty"
-    assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
-    assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
-    assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
-    assert np.max(measure_id) < size[0], "measure_id elements must be smaller than the input matrix size"
-
-    assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
-    assert hidden_id.size > 0, "hidden_id must not be empty"
-    assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
-    assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
-    assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
-    assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
-
+    level = base.validation_level()
+    size = np.shape(W)
     num_m = len(measure_id)
     num_h = len(hidden_id)
-    assert size[0] == (num_m + num_h), "Total number of elements in measure_id and hidden_id does not equal the number of rows of M"
+    if level != "off":
+        assert type(W) == np.ndarray, "W must be of type 'numpy.ndarray'"
+        assert W.size > 0, "W must not be empty"
+        assert W.dtype == int or W.dtype == float, "W must be of dtype 'int' or 'float'"
+        assert len(size) == 2, "W must be 2D shape"
+        assert size[0] == size[1], "W must be a square matrix"
+
+        assert type(measure_id) == np.ndarray, "measure_id must be of type 'np.ndarray'"
+        assert measure_id.size > 0, "measure_id must not be empty"
+        assert measure_id.dtype == int, "measure_id must be of dtype 'int'"
+        assert len(measure_id.shape) == 1, "measure_id must be 1D shape"
+
+        assert type(hidden_id) == np.ndarray, "hidden_id must be of type 'np.ndarray'"
+        assert hidden_id.size > 0, "hidden_id must not be empty"
+        assert hidden_id.dtype == int, "hidden_id must be of dtype 'int'"
+        assert len(hidden_id.shape) == 1, "hidden_id must be 1D shape"
+
+        assert size[0] == (num_m + num_h), "Total number of elements in measure_id and hidden_id does not equal the number of rows of M"
+
+        assert (type(a) == int or type(a) == float) and np.isfinite(a), "Dynamical constant a must be a real number"
+    if level == "full":
+        assert np.isfinite(W).all(), "Elements of W must be finite real numbers"
+        assert (np.diag(W) == 0).all(), "W must not have self-loop"
+        assert np.allclose(W, W.T), "W must be symmetric\n C matrix currently is defined for bi-directional network only"
+        assert (measure_id >= 0).all(), "measure_id elements must be non-negative integers"
+        assert np.max(measure_id) < size[0], "measure_id elements must be smaller than the input matrix size"
+        assert (hidden_id >= 0).all(), "hidden_id elements must be non-negative integers"
+        assert np.max(hidden_id) < size[0], "hidden_id elements must be smaller than the input matrix size"
+        all_id = np.unique(np.concatenate((measure_id, hidden_id)))
+        assert len(all_id) == size[0], "mesure_id and hidden_id contain common elements"
+
+    # NOTE: The inputs are checked above, so the functions below trust them
+    with base.validation("off"):
+        # Compute the Laplacian matrix
+        L = laplacian(W)
+
+        # Re-arrange the Laplacian matrix
+        E = base.block_off_up(L, measure_id, hidden_id)
+        Lh = base.block_diag_low(L, hidden_id)
+
+        # Compute the C matrix
+        # NOTE: Lh is positive semi-definite, so H is inverted with one Cholesky factorization for a >= 0
+        H = Lh + a * np.identity(num_h)
+        H_inv = base.spd_inverse(H) if a >= 0 else base.inverse(H)
+    C = np.matmul(np.matmul(E, H_inv), E.T)
 
-    all_id = np.unique(np.concatenate((measure_id, hidden_id)))
-    assert len(all_id) == size[0], "mesure_id and hidden_id contain common elements"
+    if not np.allclose(C, C.T):
+        print("[WARN] The computed C matrix is not symmetric")
 
-    assert (type(a) == int or type(a) == float) and np.isfinite(a), "Dynamical constant a must be a real number"
+    return C
 
-    # Compute the Laplacian matrix
-    L = laplacian(W)
 
-    # Re-arrange the Laplacian matrix
-    E = base.block_off_up(L, measure_id, hidden_id)
-    Lh = base.block_diag_low(L, hidden_id)
+def hidden_effect_spectrum(W, measure_id, hidden_id, a, tol=1e5):
+    '''
+    Compute hidden node effect (C matrix) for many values of the dynamical constant a.
 
-    # Compute the C matrix
-    H = Lh + a * np.identity(num_h)
-    H_inv = base.inverse(H)
-    C = np.matmul(np.matmul(E, H_inv), E.T)
+    Since Lh is symmetric, it is eigendecomposed once, Lh = V diag(lambda) V^T, then
 
-    if not np.allclose(C, C.T):
-        print("[WARN] The computed C matrix is not symmetric")
+        C(a) = E (Lh + aI)^-1 E^T = F diag(1 / (lambda + a)) F^T,   with F = E V
+
+    so each value of a costs one matrix product instead of an inversion
+
+    Arguments:
+    1. W:               Weighted adjacency matrix (dense or scipy.sparse CSR)
+    2. measure_id:      Measured node indices
+    3. hidden_id:       Hidden node indices
+    4. a:               Values of the dynamical constant (1D array or list of real numbers)
+    5. tol:             Tolerance value of condition number of Lh + aI (default: 1e5)
+
+    Returns:
+    1. C:       C matrices of each value of a with shape (len(a), n, n)
+
+    Raises:
+    1. base.SingularMatrixError if Lh + aI of any a is not positive definite or highly singular
+    '''
+    level = base.validation_level()
+    a = np.asarray(a, dtype=float)
+    if level != "off":
+        assert type(W) == np.ndarray or sparse.issparse(W), "W must be of type 'numpy.ndarray' or scipy.sparse matrix"
+        assert type(measure_id) == np.ndarray and measure_id.dtype == int and len(measure_id.shape) == 1, "measure_id must be 1D array of dtype 'int'"
+        assert type(hidden_id) == np.ndarray and hidden_id.dtype == int and len(hidden_id.shape) == 1, "hidden_id must be 1D array of dtype 'int'"
+        assert measure_id.size > 0 and hidden_id.size > 0, "measure_id and hidden_id must not be empty"
+        assert W.shape[0] == (len(measure_id) + len(hidden_id)), "Total number of elements in measure_id and hidden_id does not equal the number of rows of W"
+        assert len(a.shape) == 1 and a.size > 0, "a must be a non-empty 1D array of real numbers"
+        assert (type(tol) == int or type(tol) == float) and tol > 0, "tol must be a positive real number"
+    if level == "full":
+        assert np.isfinite(a).all(), "Values of a must be real numbers"
+        assert abs(W - W.T).max() <= 1e-8 * abs(W).max(), "W must be symmetric\n C matrix currently is defined for bi-directional network only"
+        all_id = np.unique(np.concatenate((measure_id, hidden_id)))
+        assert len(all_id) == W.shape[0] and all_id[0] == 0, "mesure_id and hidden_id must be a partition of the nodes of W"
+
+    # NOTE: W is checked in laplacian, L is sparse if W is sparse
+    L = laplacian(W).astype(float)
+
+    # Re-arrange the Laplacian matrix
+    if sparse.issparse(L):
+        E = L[measure_id][:, hidden_id]
+        Lh = L[hidden_id][:, hidden_id].toarray()
+    else:
+        with base.validation("off"):
+            E = base.block_off_up(L, measure_id, hidden_id)
+            Lh = base.block_diag_low(L, hidden_id)
+
+    # Eigendecomposition of the hidden block
+    lam, V = np.linalg.eigh(Lh)
+    F = np.asarray(E @ V)
+
+    # Check that Lh + aI is positive definite and well conditioned for all a
+    shifted = lam[np.newaxis] + a[:, np.newaxis]
+    if (shifted[:, 0] <= 0).any() or (shifted[:, -1] >= tol * shifted[:, 0]).any():
+        raise base.SingularMatrixError("Lh + aI is not positive definite or highly singular for some a")
+
+    # C(a) = X X^T with X = F diag(1 / sqrt(lambda + a)),
+    # NumPy computes X @ X.T with a symmetric rank-k update (BLAS syrk) at half the cost of a general product
+    C = np.empty((a.size, F.shape[0], F.shape[0]))
+    for k in range(a.size):
+        X = F / np.sqrt(shifted[k])
+        C[k] = X @ X.T
 
     return C
@@ -0,0 +1,832 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+
+ROOT_DIR = os.path.abspath("../")
+sys.path.append(ROOT_DIR)
+from utils import hooks
+from utils import jit
+from utils import moments
+from utils import network
+
+
+class TimeSeriesWriter:
+    '''
+    Stream sampled states to a .npy file on disk in fixed-size chunks.
+    Only one chunk is held in memory, so the memory usage does not grow with
+    the number of samples. The file can be loaded with np.load(path, mmap_mode='r')
+
+    Arguments:
+    1. path:        File path of the time series (.npy)
+    2. row_shape:   Shape of one sampled state
+    3. n_rows:      Total number of samples
+    4. chunk:       Number of samples buffered before each write (default: 1024)
+    5. start:       Number of samples already in the file, to continue a
+                    checkpointed run (default: 0, i.e. create a new file)
+    '''
+
+    def __init__(self, path, row_shape, n_rows, chunk=1024, start=0):
+        assert type(path) == str, "path must be a file path"
+        assert type(n_rows) == int and n_rows > 0, "n_rows must be a positive integer"
+        assert type(chunk) == int and chunk > 0, "chunk must be a positive integer"
+        assert type(start) == int and 0 <= start <= n_rows, "start must be a non-negative integer not greater than n_rows"
+
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        self.n_rows = n_rows
+        self.row_bytes = int(np.prod(self.row_shape)) * np.dtype(float).itemsize
+
+        if start > 0:
+            assert os.path.exists(path), "The time series file of the checkpointed run does not exist"
+            old = np.load(path, mmap_mode='r')
+            assert old.shape[1:] == self.row_shape, "The time series file does not match the shape of the state"
+            old_rows = old.shape[0]
+            del old
+
+            # Extend the file of a finished run to the new number of samples
+            if old_rows != n_rows:
+                self._create(path + ".tmp.npy")
+                with open(path, 'rb') as f_old, open(path + ".tmp.npy", 'r+b') as f_new:
+                    f_old.seek(self._offset(path))
+                    f_new.seek(self._offset(path + ".tmp.npy"))
+                    for i in range(0, start, chunk):
+                        f_new.write(f_old.read(min(chunk, start - i) * self.row_bytes))
+                os.replace(path + ".tmp.npy", path)
+        else:
+            self._create(path)
+
+        self.offset = self._offset(path)
+        self.pos = start
+        self.buffer = np.zeros((chunk,) + self.row_shape)
+        self.k = 0
+
+    def _create(self, path):
+        # open_memmap only writes the header and allocates the file lazily
+        f = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(self.n_rows,) + self.row_shape)
+        del f
+
+    def _offset(self, path):
+        # Size of the .npy header in bytes
+        with open(path, 'rb') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                np.lib.format.read_array_header_1_0(f)
+            else:
+                np.lib.format.read_array_header_2_0(f)
+            return f.tell()
+
+    def write(self, row):
+        '''
+        Add one sampled state to the time series
+        '''
+        self.buffer[self.k] = row
+        self.k += 1
+
+        if self.k == self.buffer.shape[0]:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write the buffered samples to disk
+        '''
+        if self.k == 0:
+            return
+
+        with open(self.path, 'r+b') as f:
+            f.seek(self.offset + self.pos * self.row_bytes)
+            f.write(self.buffer[:self.k].tobytes())
+
+        self.pos += self.k
+        self.k = 0
+
+
+def auto_dt(J0, coupling, L, method="euler", safety=0.1):
+    '''
+    Choose the integration time step and the sampling time step from the
+    spectrum of the dynamics linearized around the fixed point.
+
+    With the eigenvalues lam of the Laplacian L, the Jacobian matrix of the network
+    decouples into the d x d blocks J0 - lam * diag(coupling). Since lam lies within
+    [0, rho] with the spectral radius rho of L (see spectral_radius in utils/network.py),
+    the eigenvalues mu of the blocks over this range give
+      - the largest stable step of the explicit integrators:  min 2 Re(-mu) / |mu|^2
+      - the slowest decay rate min Re(-mu), whose inverse is the correlation time
+
+    Arguments:
+    1. J0:          Jacobian matrix (d x d) of the local dynamics of a single node at the fixed point
+    2. coupling:    1D array (d,) with 1 for the state variables coupled through -L x, otherwise 0
+    3. L:           Weighted Laplacian matrix (dense or sparse)
+    4. method:      Integrator (see simulate) (default: "euler")
+                    The linear term -L x does not limit the step of method "exponential"
+    5. safety:      Fraction of the largest stable step to use (default: 0.1)
+
+    Returns:
+    1. int_dt:      Integration time step
+    2. sample_dt:   Sampling time step, about the correlation time of the slowest mode
+                    such that the samples are roughly decorrelated
+    '''
+    assert type(J0) == np.ndarray and len(J0.shape) == 2 and J0.shape[0] == J0.shape[1], "J0 must be a square matrix"
+    assert type(coupling) == np.ndarray and coupling.shape == (J0.shape[0],), "coupling must be a 1D array of the same size as J0"
+    assert (type(safety) == int or type(safety) == float) and 0 < safety <= 1, "safety must be a real number within (0, 1]"
+
+    rho = network.spectral_radius(L)
+
+    # Eigenvalues of the blocks over the spectrum of L
+    lams = np.linspace(0, rho, 9)
+    mus = np.concatenate([np.linalg.eigvals(J0 - lam * np.diag(coupling)) for lam in lams])
+    mus_stiff = np.linalg.eigvals(J0) if method == "exponential" else mus
+
+    # Largest stable step of the explicit part: |1 + mu dt| < 1
+    # NOTE: unstable modes (e.g. chaotic dynamics) only limit the step by their time scale 1/|mu|
+    stable = mus_stiff.real < 0
+    dt_max = np.inf
+    if stable.any():
+        dt_max = np.min(2 * (-mus_stiff[stable].real) / np.abs(mus_stiff[stable])**2)
+    if (~stable).any() and np.max(np.abs(mus_stiff[~stable])) > 0:
+        dt_max = min(dt_max, 1 / np.max(np.abs(mus_stiff[~stable])))
+    assert np.isfinite(dt_max), "The time step cannot be determined since J0 is zero"
+
+    int_dt = float(safety * dt_max)
+
+    # Correlation time of the slowest decaying mode
+    if (mus.real < 0).any():
+        sample_dt = float(1 / np.min(-mus[mus.real < 0].real))
+    else:
+        sample_dt = 10 * int_dt
+    sample_dt = max(sample_dt, 2 * int_dt)
+
+    return int_dt, sample_dt
+
+
+def resolve_dt(int_dt, sample_dt, J0, coupling, L, method="euler"):
+    '''
+    Replace the time steps given as "auto" by those of auto_dt
+
+    Arguments:
+    1. int_dt:        Integration time step, or "auto"
+    2. sample_dt:     Sampling time step, or "auto"
+    3. J0:            Jacobian matrix of the local dynamics (see auto_dt)
+    4. coupling:      Coupled state variables (see auto_dt)
+    5. L:             Weighted Laplacian matrix
+    6. method:        Integrator (see simulate) (default: "euler")
+
+    Returns:
+    1. int_dt:        Integration time step
+    2. sample_dt:     Sampling time step
+    '''
+    if int_dt != "auto" and sample_dt != "auto":
+        return int_dt, sample_dt
+
+    auto_int_dt, auto_sample_dt = auto_dt(J0, coupling, L, method)
+
+    if int_dt == "auto" and sample_dt == "auto":
+        int_dt, sample_dt = auto_int_dt, auto_sample_dt
+    elif int_dt == "auto":
+        int_dt = min(auto_int_dt, sample_dt / 2)
+    else:
+        sample_dt = max(auto_sample_dt, 2 * int_dt)
+
+    print("Automatic time steps: int_dt = {:.3e}, sample_dt = {:.3e}".format(int_dt, sample_dt))
+
+    return int_dt, sample_dt
+
+
+def initial_state(shape, seed=None, dtype=float):
+    '''
+    Random initial state of all nodes around 0.5
+
+    Arguments:
+    1. shape:     Shape of the state
+    2. seed:      Seed of the simulation (default: None, i.e. use the global RNG)
+                  The initial state is drawn from a stream separated from the noise of simulate()
+    3. dtype:     Data type of the state (default: float)
+                  NOTE: The state is drawn in float64 and then rounded,
+                        so it does not depend on dtype up to the rounding
+
+    Returns:
+    1. state:     Initial state
+    '''
+    if seed is None:
+        return np.random.normal(loc=0.5, scale=0.01, size=shape).astype(dtype)
+
+    # NOTE: The child (0,) of the seed is reserved for the initial state, the noise of simulate() is drawn
+    #       from the seed itself, or from the children (1,), (2,), ... with chains > 1
+    seq = np.random.SeedSequence(seed)
+    rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(seq.entropy, spawn_key=(0,))))
+
+    return rng.normal(loc=0.5, scale=0.01, size=shape).astype(dtype)
+
+
+def save_checkpoint(path, t, state, acc, ts, sample_inter, sample_start, rng, noise, j):
+    '''
+    Write the current progress of simulate() to disk
+
+    Arguments:
+    1. path:           File path of the checkpoint (.npz)
+    2. t:              Number of integration steps done
+    3. state:          Current state of all nodes
+    4. acc:            List of MomentAccumulator (one per replica)
+    5. ts:             Sampled time series of the first node (or None)
+    6. sample_inter:   Sampling interval in integration steps
+    7. sample_start:   Time step to start sampling
+    8. rng:            numpy Generator of the noise
+    9. noise:          Buffer of the pre-drawn noise
+    10. j:             Index of the next unused noise in the buffer
+    '''
+    # NOTE: Since this function is expected to be called from simulate,
+    # we do not intend to add assertions as it is checked in simulate already
+    for a in acc:
+        a.fold()
+
+    data = dict(t=t, state=state,
+                sample_inter=sample_inter, sample_start=sample_start,
+                rng_state=json.dumps(rng.bit_generator.state), noise=noise, j=j,
+                count=np.array([a.count for a in acc]),
+                m_01=np.stack([a.m_01 for a in acc]),
+                M2=np.stack([a.M2 for a in acc]))
+    if ts is not None:
+        data['ts'] = ts
+
+    # Lagged moments and the last samples of the ring buffer
+    if isinstance(acc[0], moments.LagAccumulator):
+        m = acc[0].max_lag
+        data.update(lags=acc[0].lags,
+                    lag_S=np.stack([a.S for a in acc]),
+                    lag_s_a=np.stack([a.s_a for a in acc]),
+                    lag_s_b=np.stack([a.s_b for a in acc]),
+                    lag_pairs=np.stack([a.pairs for a in acc]),
+                    lag_shift=np.stack([a.shift for a in acc]),
+                    lag_history=np.stack([a.history[:m] for a in acc]),
+                    lag_filled=np.array([a.filled for a in acc]))
+
+    # Write to a temporary file first such that an interrupted write
+    # never corrupts the previous checkpoint
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **data)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, state, acc, rng, noise):
+    '''
+    Restore the progress of simulate() from disk
+
+    Arguments:
+    1. path:        File path of the checkpoint (.npz)
+    2. state:       State array to be overwritten by the checkpointed state
+    3. acc:         List of MomentAccumulator to be overwritten by the checkpointed moments
+    4. rng:         numpy Generator to be restored to the checkpointed state
+    5. noise:       Buffer of the pre-drawn noise to be overwritten by the checkpointed one
+
+    Returns:
+    1. t:              Number of integration steps done
+    2. ts:             Sampled time series of the first node (or None)
+    3. sample_inter:   Sampling interval in integration steps of the checkpointed run
+    4. sample_start:   Time step to start sampling of the checkpointed run
+    5. j:              Index of the next unused noise in the buffer
+    '''
+    with np.load(path) as data:
+        assert data['state'].shape == state.shape, "The checkpoint does not match the shape of the state"
+
+        assert data['M2'].shape[1:] == acc[0].M2.shape, "The checkpoint was written with a different observe"
+
+        state[...] = data['state']
+
+        for i, a in enumerate(acc):
+            a.count = int(data['count'][i])
+            a.m_01[:] = data['m_01'][i]
+            a.M2[...] = data['M2'][i]
+            a.k = 0
+
+        if isinstance(acc[0], moments.LagAccumulator):
+            assert 'lags' in data and np.array_equal(data['lags'], acc[0].lags), "The checkpoint was written with different lags"
+            m = acc[0].max_lag
+            for i, a in enumerate(acc):
+                a.S[...] = data['lag_S'][i]
+                a.s_a[...] = data['lag_s_a'][i]
+                a.s_b[...] = data['lag_s_b'][i]
+                a.pairs[...] = data['lag_pairs'][i]
+                a.shift[...] = data['lag_shift'][i]
+                a.history[:m] = data['lag_history'][i]
+                a.filled = int(data['lag_filled'][i])
+
+        rng_state = json.loads(str(data['rng_state']))
+        assert rng_state['bit_generator'] == type(rng.bit_generator).__name__, "The checkpoint was written with a different bit_generator"
+        rng.bit_generator.state = rng_state
+
+        # The pre-drawn noise is only reused if the block size is unchanged,
+        # otherwise continue with a fresh block
+        if data['noise'].shape == noise.shape:
+            noise[...] = data['noise']
+            j = int(data['j'])
+        else:
+            j = noise.shape[0]
+
+        ts = data['ts'] if 'ts' in data else None
+
+        return int(data['t']), ts, int(data['sample_inter']), int(data['sample_start']), j
+
+
+def exponential_factors(L, int_dt):
+    '''
+    Precompute the factors of the exponential (integrating factor) scheme,
+    which integrates the linear term -L x of the drift exactly.
+    With the eigendecomposition L = V diag(lam) V^T of the symmetric L:
+
+        x(t+dt) = V [ e * V^T x(t) + phi * V^T g(x(t)) + sigma * sqrt(q) * xi ]
+
+    where g is the rest of the drift, xi ~ N(0, I), and
+        e   = exp(-lam dt)
+        phi = (1 - exp(-lam dt)) / lam
+        q   = (1 - exp(-2 lam dt)) / (2 lam)
+
+    Arguments:
+    1. L:         Symmetric weighted Laplacian matrix (dense or sparse)
+    2. int_dt:    Integration time step
+
+    Returns:
+    1. V:         Eigenvectors of L
+    2. e:         Propagator of the linear term in the eigenbasis
+    3. phi:       Weight of the rest of the drift in the eigenbasis
+    4. q:         Variance of the noise (per unit sigma^2) in the eigenbasis
+    '''
+    L = L.toarray() if hasattr(L, "toarray") else L
+    L = L.astype(float)
+    assert np.allclose(L, L.T), "L must be symmetric for the exponential scheme"
+
+    lam, V = np.linalg.eigh(L)
+
+    # Use the limit lam -> 0 for the (near) zero eigenvalues
+    small = np.abs(lam) < 1e-12
+    lam_safe = np.where(small, 1.0, lam)
+    e = np.exp(-lam * int_dt)
+    phi = np.where(small, int_dt, -np.expm1(-lam * int_dt) / lam_safe)
+    q = np.where(small, int_dt, -np.expm1(-2 * lam * int_dt) / (2 * lam_safe))
+
+    return V, e, phi, q
+
+
+def run_chain(job):
+    '''
+    Run one independent chain of simulate() with its own RNG stream.
+    It is a module-level function such that it can be sent to a worker process
+
+    Arguments:
+    1. job:     Tuple of (args, options) where args are the positional
+                arguments and options the keyword options of simulate()
+
+    Returns:
+    1. acc:     List of MomentAccumulator of the chain (see simulate)
+    2. ts:      Sampled time series of the first node of the chain (see simulate)
+    '''
+    args, options = job
+
+    return simulate(*args, **options)
+
+
+def chain_path(path, i):
+    '''
+    File path of the i-th chain, e.g. run.npz -> run_chain0.npz
+    '''
+    if path is None:
+        return None
+
+    root, ext = os.path.splitext(path)
+
+    return "{}_chain{}{}".format(root, i, ext)
+
+
+def simulate_compiled(jit_drift, state, sigma, int_dt, sample_inter, sample_start, T, t_start,
+                      acc, ts, writer, ts_all, rng, noise, j, method, checkpoint, checkpoint_inter,
+                      convergence, observe, hook, t_event):
+    '''
+    Integration loop of simulate() with the "numba" backend.
+    The compiled loop of utils/jit.py advances the state by many steps and collects a block of samples
+    in one call, which is folded into the moments at once. It only returns to Python to refill the noise,
+    write a checkpoint or check the convergence
+
+    Arguments:
+    1. jit_drift:   Tuple (name, args) of the compiled drift and the arguments to build its params
+    2. others:      Variables of simulate() with the same names
+                    (T is the total number of iteration, t_start the step to continue from,
+                    t_event the next step to call the hook at)
+
+    Returns:
+    1. T:           Total number of iteration (smaller than T if the covariance matrix has converged)
+    2. ts:          Sampled time series of the first node (or None)
+    3. j:           Index of the next unused noise in the buffer
+    '''
+    # NOTE: Since this function is expected to be called from simulate,
+    # we do not intend to add assertions as it is checked in simulate already
+    integrate = jit.kernel(jit_drift[0])
+    params = jit.PARAMS[jit_drift[0]](*jit_drift[1])
+
+    N = state.shape[1]
+    observe = np.arange(N) if observe is None else observe
+    noise_std = float(sigma*np.sqrt(int_dt))
+    heun = method == "heun"
+
+    # Blocks of samples of each call, of the same size as the block of the accumulator
+    K = acc[0].block
+    X = np.zeros((K, observe.size))
+    F = np.zeros(((K if writer is not None else 0),) + state.shape)
+    ts_out = ts if ts is not None else np.zeros((state.shape[0], 0))
+
+    t = t_start
+    while t < T:
+        if j == noise.shape[0]:
+            rng.standard_normal(out=noise)
+            j = 0
+
+        # Stop at the next checkpoint, the next call of the hook and the next convergence check
+        t_stop = t_event
+        if checkpoint is not None and checkpoint_inter is not None:
+            t_stop = min(t_event, (t // checkpoint_inter + 1) * checkpoint_inter)
+        k_stop = K
+        if convergence is not None:
+            k_stop = min(K, convergence.check_inter - len(acc[0]) % convergence.check_inter)
+
+        t, j, k, status = integrate(state, params, noise, j, noise_std, int_dt, heun, t, t_stop,
+                                    sample_inter, sample_start, observe, X, k_stop, F, ts_out)
+
+        # Stop the program if there is at least one node blows up
+        if status != 0:
+            assert False, "The dynamics blows up!"
+
+        # Sample 1st and 2nd moment
+        if k > 0:
+            acc[0].push_block(X[:k])
+
+            # Stream the states of all nodes to disk
+            if writer is not None:
+                for i in range(k):
+                    writer.write(F[i] if ts_all else F[i, 0])
+
+            # Stop once the covariance matrix has converged
+            if convergence is not None and len(acc[0]) % convergence.check_inter == 0 and convergence.check(acc):
+                print("Converged after {} samples".format(convergence.samples))
+                T = t
+                if ts is not None:
+                    ts = ts[:, :(t - 1) // sample_inter + 1]
+                break
+
+        if checkpoint is not None and checkpoint_inter is not None and t % checkpoint_inter == 0:
+            if writer is not None:
+                writer.flush()
+            save_checkpoint(checkpoint, t, state, acc, ts, sample_inter, sample_start, rng, noise, j)
+
+        # NOTE: t_event is T without hook, and the hook is not called at T
+        if t == t_event and t < T:
+            if t == sample_start:
+                hook.phase("sampling", t)
+            hook.update(t, len(acc[0]))
+            t_event = hooks.next_event(t, hook.inter, sample_start, T)
+
+    return T, ts, j
+
+
+def simulate(drift, params, state, sigma, int_dt, sample_inter, sample_start, data_num,
+             get_ts=False, checkpoint=None, checkpoint_inter=None, resume=False,
+             ts_file=None, ts_all=False, ts_chunk=1024, chains=1, processes=None, seed=None,
+             noise_block=None, bit_generator="PCG64", method="euler", laplacian=None, coupled=1, convergence=None,
+             observe=None, lags=None, backend="auto", jit_drift=None, hook=None):
+    '''
+    Solve a set of coupled SDEs using Euler-Maruyama method (or the integrator of method)
+
+        d state = drift(state, *params) dt + sigma dB
+
+    where the white noise is injected on the first state variable (x-state) only,
+    and accumulate the moments of the sampled x-state of all nodes.
+
+    Arguments:
+    1. drift:              Function drift(state, *params) returning d state / dt
+                           with the same shape as state
+    2. params:             Tuple of extra arguments passed to drift
+    3. state:              Initial state with shape (d, N) for d state variables of N nodes,
+                           or (d, N, R) for R independent replicas. It is updated in place
+                           The state and the drift are computed in the dtype of state (float32 or float64),
+                           while the noise is drawn and the moments are accumulated in float64
+    4. sigma:              Noise strength (standard deviation of Gaussian distribution)
+    5. int_dt:             Integration time step
+    6. sample_inter:       Sampling interval in integration steps
+    7. sample_start:       Time step to start sampling
+    8. data_num:           Number of sampled data (of each replica)
+    9. get_ts:             To sample time series of the first node or not (default: False)
+    10. checkpoint:        File path to write checkpoints to (default: None)
+    11. checkpoint_inter:  Number of integration steps between two checkpoints
+                           (default: None, i.e. only write at the end of the run)
+    12. resume:            To continue from the checkpoint file if it exists (default: False)
+                           A finished run is extended if data_num is larger than
+                           that of the checkpointed run, without repeating the transient
+    13. ts_file:           File path (.npy) to stream the sampled states of all nodes to
+                           (default: None). The file has shape (data_num, N) or (data_num, N, R)
+    14. ts_all:            To also stream the other state variables, then the file has
+                           shape (data_num, d, N) or (data_num, d, N, R) (default: False)
+    15. ts_chunk:          Number of samples held in memory before each write to ts_file (default: 1024)
+    16. chains:            Number of independent chains P to split data_num into (default: 1)
+                           Every chain starts from state, runs its own transient of sample_start steps
+                           with its own RNG stream, and the moments of all chains are merged exactly.
+                           The checkpoint and ts_file of chain i get the suffix "_chain<i>"
+    17. processes:         Number of worker processes for the chains (default: None, i.e. number of CPUs)
+                           NOTE: Limit the BLAS threads of each worker (e.g. OMP_NUM_THREADS=1)
+                                 when running as many chains as cores
+    18. seed:              Seed of the noise (default: None, i.e. drawn from the global RNG,
+                           such that np.random.seed makes the run reproducible)
+                           Use the same seed for initial_state to make the whole run reproducible
+    19. noise_block:       Number of steps of noise drawn at once into a reused buffer
+                           (default: None, i.e. a buffer of about 8 MB)
+                           NOTE: The noise does not depend on noise_block for a given seed
+    20. bit_generator:     Bit generator of numpy.random.Generator, "PCG64" or "Philox" (default: "PCG64")
+    21. method:            Integrator (default: "euler")
+                           - "euler":        Euler-Maruyama
+                           - "heun":         Stochastic Heun (predictor-corrector), two drift evaluations per step
+                           - "milstein":     Milstein. NOTE: The noise is additive, so the Milstein
+                                             correction vanishes and it is identical to "euler"
+                           - "exponential":  Exponential Euler, the linear term -L x of the coupled states is
+                                             integrated exactly using the eigendecomposition of the symmetric
+                                             Laplacian (see exponential_factors), at O(N^2) per step
+    22. laplacian:         Weighted Laplacian matrix L of the linear term -L x of the drift,
+                           required by method "exponential" (given by the gen_cov models)
+    23. coupled:           Number of state variables coupled through -L x, i.e. the first
+                           coupled rows of state (default: 1)
+    24. convergence:       moments.ConvergenceMonitor to stop the simulation before data_num samples
+                           once the covariance matrix has converged (default: None, i.e. take all data_num samples)
+                           The number of samples used is printed and kept in convergence.samples.
+                           NOTE: The rows of ts_file after the samples used are left as zeros
+    25. observe:           Indices of the observed (measured) nodes, only the moments of their x-state
+                           are accumulated (default: None, i.e. all nodes). The dynamics of all nodes is
+                           still integrated, but the moments cost O(n^2) instead of O(N^2) for n observed nodes
+    26. lags:              Time lags in number of samples (positive integers) of the lagged covariance matrices
+                           accumulated in the same pass (default: None, i.e. equal-time moments only).
+                           Then acc is a list of moments.LagAccumulator
+    27. backend:           "numpy", "numba", or "auto" to use "numba" if it is installed and supported (default: "auto")
+                           The "numba" backend runs many integration steps and collects a block of samples
+                           in one compiled call (see utils/jit.py). It supports a single replica
+                           and the methods "euler", "milstein" and "heun".
+                           NOTE: A run is bitwise reproducible for a given seed within each backend,
+                                 but the two backends differ by rounding errors
+    28. jit_drift:         Tuple (name, args) of the compiled drift of utils/jit.py equivalent to drift
+                           and the arguments of its params builder (jit.PARAMS[name]), which is only called
+                           if the compiled loop is used
+                           (given by the gen_cov models), required by the "numba" backend
+    29. hook:              hooks.Hook called at the beginning of each phase ("burn-in", "sampling", "finalize")
+                           and every hook.inter integration steps, e.g. hooks.ProgressHook for a progress bar
+                           or hooks.MetricsHook to record the metrics (default: None, i.e. no instrumentation)
+                           NOTE: Without hook the integration loop does no instrumentation work
+
+    Returns:
+    1. acc:      List of MomentAccumulator of the sampled x-state (one per replica)
+    2. ts:       Sampled time series of the first node with shape (d, T/sample_inter)
+                 (first replica only), or None if get_ts is False
+    '''
+    assert type(state) == np.ndarray and state.ndim in (2, 3), "state must be a 2D or 3D 'numpy.ndarray'"
+    assert state.dtype in (np.float32, np.float64), "state must be of dtype 'float32' or 'float64'"
+    assert type(sample_inter) == int and sample_inter > 0, "sample_inter must be a positive integer"
+    assert type(sample_start) == int and sample_start >= 0, "sample_start must be a non-negative integer"
+    assert type(data_num) == int and data_num > 0, "data_num must be a positive integer"
+    assert checkpoint is None or type(checkpoint) == str, "checkpoint must be a file path"
+    assert checkpoint_inter is None or (type(checkpoint_inter) == int and checkpoint_inter > 0), "checkpoint_inter must be a positive integer"
+    assert type(resume) == bool, "resume must be boolean"
+    assert not resume or checkpoint is not None, "checkpoint must be given to resume"
+    assert ts_file is None or type(ts_file) == str, "ts_file must be a file path"
+    assert type(ts_all) == bool, "ts_all must be boolean"
+    assert type(ts_chunk) == int and ts_chunk > 0, "ts_chunk must be a positive integer"
+    assert type(chains) == int and 0 < chains <= data_num, "chains must be a positive integer not greater than data_num"
+    assert processes is None or (type(processes) == int and processes > 0), "processes must be a positive integer"
+    assert seed is None or (type(seed) == int and seed >= 0) or isinstance(seed, np.random.SeedSequence), "seed must be a non-negative integer"
+    assert noise_block is None or (type(noise_block) == int and noise_block > 0), "noise_block must be a positive integer"
+    assert bit_generator in ("PCG64", "Philox"), "bit_generator must be 'PCG64' or 'Philox'"
+    assert method in ("euler", "heun", "milstein", "exponential"), "method must be 'euler', 'heun', 'milstein' or 'exponential'"
+    assert method != "exponential" or laplacian is not None, "laplacian must be given for method 'exponential'"
+    assert type(coupled) == int and 0 < coupled <= state.shape[0], "coupled must be a positive integer not greater than the number of state variables"
+    assert convergence is None or isinstance(convergence, moments.ConvergenceMonitor), "convergence must be of type 'ConvergenceMonitor'"
+    assert convergence is None or chains == 1, "convergence is not supported with chains > 1"
+    if observe is not None:
+        assert type(observe) == np.ndarray, "observe must be of type 'np.ndarray'"
+        assert observe.size > 0, "observe must not be empty"
+        assert observe.dtype == int, "observe must be of dtype 'int'"
+        assert len(observe.shape) == 1, "observe must be 1D shape"
+        assert (observe >= 0).all() and np.max(observe) < state.shape[1], "observe elements must be node indices"
+        assert len(np.unique(observe)) == observe.size, "observe must not contain repeated elements"
+    assert lags is None or (len(lags) > 0 and all(type(l) == int and l > 0 for l in lags)), "lags must be a sequence of positive integers"
+    assert backend in ("auto", "numpy", "numba"), "backend must be 'auto', 'numpy' or 'numba'"
+    assert hook is None or isinstance(hook, hooks.Hook), "hook must be of type 'Hook'"
+    assert hook is None or chains == 1, "hook is not supported with chains > 1"
+
+    # Use the compiled integration loop if it is available and supports the run
+    compiled = jit_drift is not None and state.ndim == 2 and method in ("euler", "milstein", "heun")
+    if backend == "numba":
+        assert jit.HAS_NUMBA, "numba is not installed"
+        assert compiled, "The numba backend requires jit_drift, a single replica and method 'euler', 'milstein' or 'heun'"
+    compiled = compiled and jit.HAS_NUMBA and backend != "numpy"
+
+    # Seed sequence of the noise
+    if seed is None:
+        seed = int(np.random.randint(2**31))
+    seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+    # Split the samples across independent chains in a process pool
+    if chains > 1:
+        # Independent RNG stream of each chain
+        # NOTE: The child (0,) is the stream of the initial state (see initial_state),
+        #       so the chains take the children (1,), (2,), ... with explicit spawn keys
+        streams = [np.random.SeedSequence(seq.entropy, spawn_key=seq.spawn_key + (i + 1,), pool_size=seq.pool_size)
+                   for i in range(chains)]
+
+        jobs = []
+        for i in range(chains):
+            chain_num = data_num // chains + (1 if i < data_num % chains else 0)
+            args = (drift, params, state.copy(), sigma, int_dt, sample_inter, sample_start, chain_num)
+            options = dict(get_ts=get_ts and i == 0,
+                           checkpoint=chain_path(checkpoint, i), checkpoint_inter=checkpoint_inter, resume=resume,
+                           ts_file=chain_path(ts_file, i), ts_all=ts_all, ts_chunk=ts_chunk,
+                           seed=streams[i], noise_block=noise_block, bit_generator=bit_generator,
+                           method=method, laplacian=laplacian, coupled=coupled, observe=observe, lags=lags,
+                           backend=backend, jit_drift=jit_drift)
+            jobs.append((args, options))
+
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(run_chain, jobs))
+
+        # Merge the moments of all chains
+        acc, ts = results[0]
+        for acc_chain, _ in results[1:]:
+            for a, a_chain in zip(acc, acc_chain):
+                a.merge(a_chain)
+
+        return acc, ts
+
+    # Total number of iteration
+    T = int((data_num) * sample_inter + sample_start)
+
+    # Shape of the noise (and the sampled x-state)
+    N = state.shape[1]
+    noise_shape = state.shape[1:]
+    replica = 1 if state.ndim == 2 else state.shape[2]
+
+    # Initialize the accumulators of the 1st and 2nd moment of the (observed) x-state of each replica
+    # They are used to compute the covariance matrix
+    n = N if observe is None else observe.size
+    if lags is None:
+        acc = [moments.MomentAccumulator(n) for _ in range(replica)]
+    else:
+        acc = [moments.LagAccumulator(n, lags) for _ in range(replica)]
+
+    # Initialize the sampled time series of the first node
+    ts = np.zeros((state.shape[0], int(T/sample_inter))) if get_ts else None
+
+    # Initialize the noise generator and the buffer of pre-drawn noise
+    # j is the index of the next unused noise in the buffer
+    rng = np.random.Generator(getattr(np.random, bit_generator)(seq))
+    if noise_block is None:
+        noise_block = max(1, 2**20 // int(np.prod(noise_shape)))
+    # NOTE: The noise is drawn in float64 for any dtype of state,
+    #       such that a float32 run sees the same noise as the float64 run of the same seed
+    noise = np.zeros((noise_block,) + noise_shape)
+    j = noise_block
+
+    # Continue from the checkpoint
+    t_start = 0
+    if resume and os.path.exists(checkpoint):
+        t_start, ts_old, old_inter, old_start, j = load_checkpoint(checkpoint, state, acc, rng, noise)
+        assert old_inter == sample_inter and old_start == sample_start, "The checkpoint was written with different sample_dt/int_dt or sample_start"
+        assert t_start <= T, "The checkpoint has more samples than data_num"
+        if get_ts and ts_old is not None:
+            ts[:, :ts_old.shape[1]] = ts_old
+
+    # Initialize the time series file of all nodes
+    # NOTE: The number of samples already written equals the number of accumulated samples
+    if ts_file is not None:
+        row_shape = state.shape if ts_all else state.shape[1:]
+        writer = TimeSeriesWriter(ts_file, row_shape, data_num, chunk=ts_chunk, start=acc[0].count)
+    else:
+        writer = None
+
+    # Standard deviation of the noise increment of each step
+    # NOTE: A Python float does not promote a float32 state to float64
+    noise_std = float(sigma*np.sqrt(int_dt))
+
+    # Factors of the exponential scheme, broadcast along the replicas
+    if method == "exponential":
+        V, e, phi, q = exponential_factors(laplacian, int_dt)
+        bshape = (N,) + (1,) * (state.ndim - 2)
+        V = V.astype(state.dtype)
+        e = e.reshape(bshape).astype(state.dtype)
+        phi = phi.reshape(bshape).astype(state.dtype)
+        q_std = (sigma * np.sqrt(q)).reshape(bshape).astype(state.dtype)
+
+    # Next step to call the hook at, which is never reached without hook
+    if hook is not None:
+        hook.begin(t_start, T)
+        hook.phase("burn-in" if t_start < sample_start else "sampling", t_start)
+        t_event = hooks.next_event(t_start, hook.inter, sample_start, T)
+    else:
+        t_event = T
+
+    # Solve the coupled SDEs in the compiled integration loop
+    if compiled:
+        T, ts, j = simulate_compiled(jit_drift, state, sigma, int_dt, sample_inter, sample_start, T, t_start,
+                                     acc, ts, writer, ts_all, rng, noise, j, method, checkpoint, checkpoint_inter,
+                                     convergence, observe, hook, t_event)
+        t_start = T
+
+    # Solve the coupled SDEs using Euler-Maruyama method
+    for t in range(t_start, T):
+        if t == t_event:
+            if t == sample_start:
+                hook.phase("sampling", t)
+            hook.update(t, len(acc[0]))
+            t_event = hooks.next_event(t, hook.inter, sample_start, T)
+
+        if j == noise_block:
+            rng.standard_normal(out=noise)
+            j = 0
+        eta = noise[j]
+        j += 1
+
+        if method == "heun":
+            dW = noise_std*eta
+            f0 = drift(state, *params)
+            pred = state + f0 * int_dt
+            pred[0] += dW
+            ds = 0.5 * (f0 + drift(pred, *params)) * int_dt
+            ds[0] += dW
+            state += ds
+
+        elif method == "exponential":
+            # Rest of the drift after removing the linear term -L x of the coupled states
+            g = drift(state, *params)
+            for k in range(coupled):
+                g[k] += laplacian @ state[k]
+
+            # NOTE: V^T eta is also standard normal, so the noise is drawn in the eigenbasis directly
+            for k in range(coupled):
+                y = e * (V.T @ state[k]) + phi * (V.T @ g[k])
+                if k == 0:
+                    y += q_std * eta
+                state[k] = V @ y
+
+            state[coupled:] += g[coupled:] * int_dt
+
+        else:
+            ds = drift(state, *params) * int_dt
+            ds[0] += noise_std*eta
+            state += ds
+
+        # Sample the node states
+        if t % sample_inter == 0:
+
+            # Stop the program if there is at least one node blows up
+            # NOTE: NaN and inf propagate, so checking at the sampling steps is enough
+            if not np.isfinite(state).all():
+                assert False, "The dynamics blows up!"
+
+            # Sample dynamics of the first node
+            if get_ts:
+                ts[:, t // sample_inter] = state[:, 0] if replica == 1 else state[:, 0, 0]
+
+            # Sample 1st and 2nd moment
+            if t >= sample_start:
+                x = state[0] if observe is None else state[0, observe]
+                if replica == 1:
+                    acc[0].push(x)
+                else:
+                    for k in range(replica):
+                        acc[k].push(x[:, k])
+
+                # Stream the states of all nodes to disk
+                if writer is not None:
+                    writer.write(state if ts_all else state[0])
+
+                # Stop once the covariance matrix has converged
+                if convergence is not None and len(acc[0]) % convergence.check_inter == 0 and convergence.check(acc):
+                    print("Converged after {} samples".format(convergence.samples))
+                    T = t + 1
+                    if get_ts:
+                        ts = ts[:, :t // sample_inter + 1]
+                    break
+
+        if checkpoint is not None and checkpoint_inter is not None and (t + 1) % checkpoint_inter == 0:
+            if writer is not None:
+                writer.flush()
+            save_checkpoint(checkpoint, t + 1, state, acc, ts, sample_inter, sample_start, rng, noise, j)
+
+    if hook is not None:
+        hook.phase("finalize", T)
+
+    if writer is not None:
+        writer.flush()
+
+    for a in acc:
+        a.fold()
+
+    if checkpoint is not None:
+        save_checkpoint(checkpoint, T, state, acc, ts, sample_inter, sample_start, rng, noise, j)
+
+    if hook is not None:
+        hook.end(T, len(acc[0]))
+
+    return acc, ts